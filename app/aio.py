@@ -0,0 +1,687 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 异步模式: handler均为async def，基于kubernetes_asyncio，每个集群共享一个aiohttp会话
+# 启动方式: uvicorn app.aio:app
+import asyncio
+import functools
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+import yaml
+from fastapi import FastAPI, Header
+from fastapi.responses import Response, StreamingResponse
+
+from app import codec, instrument, metrics, ratelimit
+from app.applied import APPLY_SKIP_UNCHANGED, annotate, applied, applies, content_hash, object_key, unchanged
+from app.codec import JSONResponse
+from app.informer import AsyncSubscription, informers, status_body
+from app.kube import LazyModule, preload
+from app.kube import client as sync_client
+from app.lifecycle import PRELOAD, WARMUP, WARMUP_TIMEOUT, lifecycle
+from app.main import (APPLY_PATCH_CONTENT_TYPE, BATCH_CONCURRENCY, FANOUT_CONCURRENCY, FANOUT_TIMEOUT, FIELD_MANAGER,
+                      SCALE_CONCURRENCY, STREAM_PAGE_SIZE, WATCH_HEARTBEAT, BatchParams, BulkScaleParams, FanoutParams,
+                      Params, RegisterParams, UnregisterParams, WatchParams, apply_message, apply_stages,
+                      cluster_params, cluster_result, clusters_response, content_required, error_response, informer_get,
+                      informer_readable, manifest_result, name_required, raw_response, read_response, read_succeeded,
+                      readiness_response, rollout_response, scale_targets, sse_event, unsupported_kind, wait_rollout,
+                      wait_rollouts, watch_response)
+from app.main import init_cluster as init_sync_cluster
+from app.pool import POOL_SIZE, POOL_TTL, cert_dir, fingerprint, pool_requests
+from app.projection import parse_fields, project
+from app.registry import ClusterConflict, is_admin, registry
+from app.resources import KINDS, MERGE_PATCH_CONTENT_TYPE, call_async, declared_version, read_body, resolve_async
+from app.selector import parse_selector
+from app.singleflight import AsyncGroup, read_key
+
+CONNECTION_LIMIT = int(os.environ.get('K8S_ASYNC_CONNECTION_LIMIT', '1000'))  # 每个集群aiohttp会话的最大并发连接数
+CLOSE_GRACE = float(os.environ.get('K8S_CLIENT_CLOSE_GRACE', '60'))  # 淘汰的客户端延迟关闭时间(秒)，等待借用中的请求结束
+
+logger = logging.getLogger(__name__)
+
+# 与同步模式一样延迟到第一次使用或启动后的预热时导入；同步的kubernetes客户端只在/watch中使用
+client = LazyModule('kubernetes_asyncio.client')
+config = LazyModule('kubernetes_asyncio.config')
+
+app = FastAPI(default_response_class=JSONResponse)
+app.add_middleware(instrument.MetricsMiddleware, routes=app.routes)
+
+
+class AsyncClientPool:
+    """ClientPool的异步版本，缓存kubernetes_asyncio的ApiClient，淘汰时延迟关闭aiohttp会话"""
+
+    def __init__(self, loader, maxsize=POOL_SIZE, ttl=POOL_TTL):
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clients = OrderedDict()  # fingerprint -> (ApiClient, 创建时间)
+        self._building = {}  # fingerprint -> Lock，同一集群并发未命中时只加载一次
+        self._closing = set()  # 已淘汰、等待延迟关闭的客户端，进程退出时一并关闭
+
+    def _lookup(self, key):
+        entry = self._clients.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            self._clients.move_to_end(key)
+            return entry[0]
+        return None
+
+    async def get(self, config_string):
+        key = fingerprint(config_string)
+        api_client = self._lookup(key)
+        if api_client is not None:
+            self.hits += 1
+            pool_requests.inc(result='hit')
+            return api_client
+        self.misses += 1
+        pool_requests.inc(result='miss')
+
+        build_lock = self._building.setdefault(key, asyncio.Lock())
+        async with build_lock:
+            api_client = self._lookup(key)
+            if api_client is not None:
+                return api_client
+
+            with instrument.stage('load_client'):  # 解析kubeconfig并创建客户端
+                api_client = await self.loader(config_string)
+
+            old = self._clients.pop(key, None)
+            if old is not None:
+                self._close_later(old[0])
+            self._clients[key] = (api_client, time.monotonic())
+            self._building.pop(key, None)
+            while len(self._clients) > self.maxsize:
+                self._close_later(self._clients.popitem(last=False)[1][0])
+        return api_client
+
+    def evict(self, config_string):
+        entry = self._clients.pop(fingerprint(config_string), None)
+        if entry is not None:
+            self._close_later(entry[0])
+        return entry is not None
+
+    def _close_later(self, api_client):
+        loop = asyncio.get_running_loop()
+        self._closing.add(api_client)
+        loop.call_later(CLOSE_GRACE, lambda: loop.create_task(self._close(api_client)))
+
+    async def _close(self, api_client):
+        if api_client in self._closing:
+            self._closing.discard(api_client)
+            await api_client.close()
+
+    async def close(self):
+        clients = [entry[0] for entry in self._clients.values()] + list(self._closing)
+        self._clients.clear()
+        self._closing.clear()
+        await asyncio.gather(*(api_client.close() for api_client in clients), return_exceptions=True)
+
+    def __len__(self):
+        return len(self._clients)
+
+
+async def load_client(config_string):
+    configuration = client.Configuration()
+    configuration.connection_pool_maxsize = CONNECTION_LIMIT
+
+    await config.load_kube_config_from_dict(yaml.safe_load(config_string), client_configuration=configuration,
+                                            temp_file_path=os.path.join(cert_dir(), fingerprint(config_string)))
+
+    return ratelimit.install_async(instrument.install_async(client.ApiClient(configuration=configuration)),
+                                   fingerprint(config_string))
+
+
+pool = AsyncClientPool(load_client)
+_no_server_side_apply = weakref.WeakSet()  # 不支持server-side apply的集群客户端
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    # 不阻塞启动，预热完成前readyz返回503
+    lifecycle.mark('app')
+    asyncio.get_running_loop().create_task(warm_up())
+
+
+@app.on_event("shutdown")
+async def close_pool():
+    await pool.close()
+
+
+async def warm_up():
+    # 在线程中导入kubernetes_asyncio，再为已注册集群创建客户端，并请求一次/version建立keep-alive连接
+    async def warm_one(cluster_id):
+        try:
+            api_client = await init_cluster(registry.get(cluster_id))
+            await read_body(await client.VersionApi(api_client).get_code(_preload_content=False,
+                                                                        _request_timeout=WARMUP_TIMEOUT))
+        except Exception as e:
+            logger.warning('warm up cluster %s failed: %s', cluster_id, e)
+
+    if PRELOAD:
+        await asyncio.get_running_loop().run_in_executor(None, preload, client, config)
+        lifecycle.mark('preload')
+    if WARMUP:
+        await asyncio.gather(*[warm_one(cluster_id) for cluster_id in registry.ids()])
+    lifecycle.ready = True
+    logger.info('ready in %.2fs', lifecycle.mark('ready'))
+
+
+reads = AsyncGroup(cacheable=read_succeeded)
+
+
+def coalesce(handler):
+    # 相同的并发get*请求共享一次上游调用，流式输出不合并
+    @functools.wraps(handler)
+    async def wrapper(params: Params):
+        if params.stream:
+            return await handler(params)
+        return await reads.do(read_key(handler.__name__, params), lambda: handler(params))
+
+    return wrapper
+
+
+@app.post("/applyhpa")  # 更新hpa信息
+async def applyhpa(params: Params):
+    if params.content is None:
+        return content_required()
+    try:
+        ret, created, unchanged = await apply_resource(params, 'HorizontalPodAutoscaler', params.hpa)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001, 'msg': apply_message(created, unchanged),
+                                 'unchanged': unchanged, 'data': ret})
+
+
+@app.post("/applyService")  # 更新Service信息
+async def applyService(params: Params):
+    if params.content is None:
+        return content_required()
+    try:
+        ret, created, unchanged = await apply_resource(params, 'Service', params.service)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001,
+                                 'msg': f'{ret["metadata"]["name"]} {apply_message(created, unchanged)}',
+                                 'unchanged': unchanged})
+
+
+@app.post("/applyDeployment")  # 更新Deployment信息
+async def applyDeployment(params: Params):
+    if params.content is None:
+        return content_required()
+    try:
+        ret, created, unchanged = await apply_resource(params, 'Deployment', params.deployment)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    result = {'code': 1000 if created else 1001,
+              'msg': f'{ret["metadata"]["name"]} {apply_message(created, unchanged)}', 'unchanged': unchanged}
+    if params.wait:
+        result['rollout'] = await wait_rollout(params.configString, params.namespace, ret['metadata']['name'],
+                                               params.timeout, generation=ret['metadata'].get('generation'))
+    return JSONResponse(content=result)
+
+
+@app.post("/applyVirtualService")  # 更新VirtualService信息
+async def applyVirtualService(params: Params):
+    if params.content is None:
+        return content_required()
+    try:
+        ret, created, unchanged = await apply_resource(params, 'VirtualService', params.virtualService)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001, 'msg': apply_message(created, unchanged),
+                                 'unchanged': unchanged, 'data': ret})
+
+
+@app.post("/applyDestinationRule")  # 更新DestinationRule信息
+async def applyDestinationRule(params: Params):
+    if params.content is None:
+        return content_required()
+    try:
+        ret, created, unchanged = await apply_resource(params, 'DestinationRule', params.destination)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001, 'msg': apply_message(created, unchanged),
+                                 'unchanged': unchanged, 'data': ret})
+
+
+@app.post("/applyResource")  # apply任意kind的资源，kind/apiVersion/metadata取自content，结果与batchApply中的一项相同
+async def applyResource(params: Params):
+    if params.content is None:
+        return content_required()
+    api_client = await init_cluster(params.configString)  # 从连接池获取集群客户端
+    return JSONResponse(content=await apply_manifest(api_client, params.configString, params.content,
+                                                     params.namespace))
+
+
+@app.post("/batchApply")  # 批量apply多种资源
+async def batchApply(params: BatchParams):
+    api_client = await init_cluster(params.configString)  # 从连接池获取集群客户端
+
+    semaphore = asyncio.Semaphore(params.concurrency or BATCH_CONCURRENCY)
+
+    async def apply_one(i):
+        async with semaphore:
+            return await apply_manifest(api_client, params.configString, params.items[i], params.namespace)
+
+    results = [None] * len(params.items)
+    for stage in apply_stages(params.items, params.ordered):
+        for i, ret in zip(stage, await asyncio.gather(*(apply_one(i) for i in stage))):
+            results[i] = ret
+
+    return JSONResponse(content={'code': 1005, 'msg': 'Batch apply finished!!!', 'data': results})
+
+
+@app.post("/registerCluster")  # 注册集群，之后的请求可以用clusterId代替configString
+async def registerCluster(params: RegisterParams, authorization: Optional[str] = Header(None)):
+    if params.overwrite and not is_admin(authorization):
+        return JSONResponse(content={'code': 2403, 'msg': 'Forbidden'})
+    try:
+        await init_cluster(params.configString)  # 校验kubeconfig并预热客户端
+        cluster_id = registry.register(params.configString, params.clusterId, params.overwrite)
+    except ClusterConflict as e:
+        return JSONResponse(content={'code': 2409, 'msg': str(e)})
+    except Exception as e:
+        return JSONResponse(content={'code': 2400, 'msg': str(e)})
+    return JSONResponse(content={'code': 1000, 'msg': 'Register succeed!!!', 'data': {'clusterId': cluster_id}})
+
+
+@app.delete("/unregisterCluster")  # 需要携带K8S_CLUSTER_ADMIN_TOKEN
+async def unregisterCluster(params: UnregisterParams, authorization: Optional[str] = Header(None)):
+    if not is_admin(authorization):
+        return JSONResponse(content={'code': 2403, 'msg': 'Forbidden'})
+    config_string = registry.unregister(params.clusterId)
+    if config_string is None:
+        return JSONResponse(content={'code': 2404, 'msg': f'Cluster {params.clusterId} is not registered'})
+    pool.evict(config_string)
+    return JSONResponse(content={'code': 1004, 'msg': 'Success'})
+
+
+@app.get("/getClusters")  # 已注册的集群ID，需要携带K8S_CLUSTER_ADMIN_TOKEN
+async def getClusters(authorization: Optional[str] = Header(None)):
+    return clusters_response(authorization)
+
+
+@app.get("/metrics")
+async def getMetrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/livez")  # 存活探针
+async def livez():
+    return JSONResponse(content={'code': 1002, 'msg': 'alive'})
+
+
+@app.get("/readyz")  # 就绪探针，预热完成前和收到SIGTERM后返回503
+async def readyz():
+    return readiness_response()
+
+
+@app.post("/getVirtualService")  # 获取VirtualService信息
+@coalesce
+async def getVirtualService(params: Params):
+    return await read_resource(params, 'VirtualService', params.virtualService)
+
+
+@app.post("/getDestinationRule")  # 获取DestinationRule信息
+@coalesce
+async def getDestinationRule(params: Params):
+    return await read_resource(params, 'DestinationRule', params.destination)
+
+
+@app.post("/getDeployment")  # 获取Deployment信息
+@coalesce
+async def getDeployment(params: Params):
+    if params.deployment is None:
+        return name_required('Deployment')
+    return await read_resource(params, 'Deployment', params.deployment)
+
+
+@app.post("/getService")  # 获取Service信息
+@coalesce
+async def getService(params: Params):
+    if params.service is None:
+        return name_required('Service')
+    return await read_resource(params, 'Service', params.service)
+
+
+@app.post("/getPods")
+@coalesce
+async def getPods(params: Params):
+    return await read_resource(params, 'Pod')
+
+
+@app.post("/getNameSpaces")
+@coalesce
+async def getNameSpaces(params: Params):
+    return await read_resource(params, 'Namespace', key='data', error_code=1000, code=0, msg='')
+
+
+@app.post("/getNameSpace")
+@coalesce
+async def getNameSpace(params: Params):
+    return await read_resource(params, 'Namespace', params.namespace, key='data', error_code=1000, code=0, msg='')
+
+
+@app.post("/getResource")  # 获取任意kind的资源，kind未登记在KINDS中时需要指定apiVersion
+@coalesce
+async def getResource(params: Params):
+    return await read_resource(params, params.kind, params.name)
+
+
+@app.delete("/delhpa")
+async def delhpa(params: Params):
+    return await delete_resource(params, 'HorizontalPodAutoscaler', params.hpa)
+
+
+@app.delete("/delDestinationRule")
+async def delDestinationRule(params: Params):
+    return await delete_resource(params, 'DestinationRule', params.destination)
+
+
+@app.delete("/delVirtualService")
+async def delVirtualService(params: Params):
+    return await delete_resource(params, 'VirtualService', params.virtualService)
+
+
+@app.delete("/delDeployment")
+async def delDeployment(params: Params):
+    return await delete_resource(params, 'Deployment', params.deployment, msg='Success')
+
+
+@app.delete("/delService")
+async def delService(params: Params):
+    return await delete_resource(params, 'Service', params.service, msg='Success')
+
+
+@app.delete("/delResource")  # 删除任意kind的资源
+async def delResource(params: Params):
+    return await delete_resource(params, params.kind, params.name)
+
+
+@app.post("/modifyDeployment")
+async def modifyDeployment(params: Params):
+    namespace = params.namespace
+    deployment = params.deployment
+
+    api_client = await init_cluster(params.configString)  # 从连接池获取集群客户端
+
+    try:
+        ret = await scale_object(api_client, await resolve_async(api_client, 'Deployment'), namespace, deployment,
+                                 params.replicas)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2998, 'msg': codec.loads(e.body)})
+    replicas = ret['spec']['replicas']
+    result = {'code': 1001, 'msg': 'Modify succeed!!!', 'data': {'name': deployment, 'replicas': replicas}}
+    if params.wait:
+        result['rollout'] = await wait_rollout(params.configString, namespace, deployment, params.timeout,
+                                               replicas=replicas)
+    return JSONResponse(content=result)
+
+
+@app.post("/bulkScale")  # 批量修改Deployment副本数
+async def bulkScale(params: BulkScaleParams):
+    api_client = await init_cluster(params.configString)  # 从连接池获取集群客户端
+
+    selected = []
+    try:
+        resource = await resolve_async(api_client, 'Deployment')
+        if params.labelSelector is not None:
+            selected = await select_objects(api_client, resource, params.namespace, params.labelSelector)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+
+    semaphore = asyncio.Semaphore(params.concurrency or SCALE_CONCURRENCY)
+
+    async def scale_one(target):
+        async with semaphore:
+            return await scale_deployment(api_client, resource, *target)
+
+    results = await asyncio.gather(*[scale_one(target) for target in scale_targets(params, selected)])
+    if params.wait:
+        await wait_rollouts(params, [result for result in results if result['code'] == 1001])
+    return JSONResponse(content={'code': 1007, 'msg': 'Bulk scale finished!!!', 'data': results})
+
+
+@app.post("/fanoutQuery")  # 在多个集群上并发执行同一个查询
+async def fanoutQuery(params: FanoutParams):
+    handler = FANOUT_HANDLERS[params.action]
+    timeout = params.timeout or FANOUT_TIMEOUT
+    semaphore = asyncio.Semaphore(params.concurrency or FANOUT_CONCURRENCY)
+
+    async def query(i, cluster):
+        name = cluster.name or cluster.clusterId or str(i)
+        async with semaphore:
+            try:
+                ret = await asyncio.wait_for(handler(cluster_params(params, cluster, timeout)), timeout)
+            except asyncio.TimeoutError:
+                return codec.dumps({'cluster': name, 'code': 2504, 'msg': f'Timeout after {timeout}s'})
+            except Exception as e:
+                return codec.dumps({'cluster': name, 'code': 2500, 'msg': str(e)})
+        return cluster_result(name, ret.body)
+
+    results = await asyncio.gather(*[query(i, cluster) for i, cluster in enumerate(params.clusters)])
+    return raw_response(b'[%s]' % b','.join(results), key='data', code=1006, msg='Fanout finished!!!')
+
+
+@app.post("/waitRollout")  # 等待Deployment滚动更新完成，代替轮询getDeployment
+async def waitRollout(params: Params):
+    if params.deployment is None:
+        return JSONResponse(content={'code': 2999, 'msg': status_body(400, 'BadRequest', 'deployment is required')})
+    return JSONResponse(content=rollout_response(await wait_rollout(params.configString, params.namespace,
+                                                                    params.deployment, params.timeout)))
+
+
+@app.post("/watch")  # 以Server-Sent Events推送资源变化，informer使用同步客户端在后台线程中watch，订阅者共享
+async def watch(params: WatchParams, last_event_id: Optional[str] = Header(None)):
+    loop = asyncio.get_running_loop()
+    api_client = await loop.run_in_executor(None, init_sync_cluster, params.configString)
+    informer = informers.get(params.configString, api_client, params.resource, params.namespace)
+    subscription = AsyncSubscription(parse_selector(params.labelSelector), loop)
+    tree = parse_fields(params.fields)
+
+    async def generate():
+        try:
+            try:
+                # 首次订阅需要等待informer完成list
+                await loop.run_in_executor(None, informer.subscribe, subscription,
+                                           params.resourceVersion or last_event_id)
+            except sync_client.ApiException as e:
+                yield sse_event({'type': 'ERROR', 'object': codec.loads(e.body)})
+                return
+            while True:
+                event = await subscription.get(WATCH_HEARTBEAT)
+                if event is None:
+                    yield b': heartbeat\n\n'
+                    continue
+                yield sse_event(event, tree, params.managedFields)
+                if event['type'] == 'ERROR':
+                    return
+        finally:
+            informer.unsubscribe(subscription)
+
+    return watch_response(generate())
+
+
+FANOUT_HANDLERS = {
+    'getVirtualService': getVirtualService,
+    'getDestinationRule': getDestinationRule,
+    'getDeployment': getDeployment,
+    'getService': getService,
+    'getPods': getPods,
+    'getNameSpaces': getNameSpaces,
+    'getNameSpace': getNameSpace,
+    'getResource': getResource,
+}
+
+
+async def read_resource(params, kind, name=None, key='msg', error_code=2999, **fields):
+    # 与app.main.read_resource一致
+    fields = fields or {'code': 1002}
+    if informer_readable(params, kind):
+        # informer由同步客户端在后台线程中维护，首次读取要等待list完成，放到线程池中执行
+        loop = asyncio.get_running_loop()
+        sync_api_client = await loop.run_in_executor(None, init_sync_cluster, params.configString)
+        return await loop.run_in_executor(None, informer_get, params, sync_api_client, KINDS[kind][2], name)
+    api_client = await init_cluster(params.configString)  # 从连接池获取集群客户端
+
+    try:
+        resource = await resolve_async(api_client, kind, params.apiVersion)
+        if resource is None:
+            return error_response(unsupported_kind(kind, params.apiVersion), key, error_code)
+        if name is not None:
+            ret = await call_async(api_client, 'GET', resource.path(params.namespace, name),
+                                   timeout=params.requestTimeout)
+        elif params.stream:
+            return stream_list(api_client, resource.path(params.namespace), params, error_code,
+                               labelSelector=params.labelSelector)
+        else:
+            ret = await call_async(api_client, 'GET', resource.path(params.namespace),
+                                   {'labelSelector': params.labelSelector, 'limit': params.limit,
+                                    'continue': params.continue_},
+                                   timeout=params.requestTimeout)  # 如果没有指定资源名称，则输出获取到的全部资源列表
+        return read_response(await read_body(ret), params, key, **fields)
+    except client.ApiException as e:
+        return error_response(codec.loads(e.body), key, error_code)
+
+
+async def apply_resource(params, kind, name):
+    api_client = await init_cluster(params.configString)  # 从连接池获取集群客户端
+    resource = await resolve_async(api_client, kind, declared_version(kind, params.content))
+    return await apply_object(api_client, params.configString, resource, params.namespace, name, params.content)
+
+
+async def delete_resource(params, kind, name, msg=None):
+    if name is None:
+        return name_required(kind)
+    api_client = await init_cluster(params.configString)  # 从连接池获取集群客户端
+    try:
+        resource = await resolve_async(api_client, kind, params.apiVersion)
+        if resource is None:
+            return JSONResponse(content={'code': 2404, 'msg': unsupported_kind(kind, params.apiVersion)})
+        res = codec.loads(await read_body(await call_async(api_client, 'DELETE',
+                                                           resource.path(params.namespace, name))))
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2998, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1004, 'msg': res if msg is None else msg})
+
+
+async def apply_object(api_client, config_string, resource, namespace, name, body):
+    # 与app.main.apply_object一致: 与上次apply的内容相同且线上对象未被改动时跳过写入
+    cluster, key, digest = fingerprint(config_string), object_key(resource, namespace, name), content_hash(body)
+    if APPLY_SKIP_UNCHANGED and applied.get(cluster, key) == digest:
+        try:
+            live = codec.loads(await read_body(await call_async(api_client, 'GET', resource.path(namespace, name))))
+        except client.ApiException as e:
+            if e.status != 404:
+                raise
+            live = None
+        if live is not None and unchanged(live, body, digest):
+            applies.inc(result='unchanged')
+            return live, False, True
+    ret, created = await server_side_apply(api_client, resource, namespace, name, annotate(body, digest))
+    applied.put(cluster, key, digest)
+    applies.inc(result='created' if created else 'updated')
+    return ret, created, False
+
+
+async def server_side_apply(api_client, resource, namespace, name, body):
+    # 一次server-side apply完成创建或更新，不支持时退回patch/create
+    path = resource.path(namespace, name)
+    if api_client not in _no_server_side_apply:
+        try:
+            resp = await call_async(api_client, 'PATCH', path, {'fieldManager': FIELD_MANAGER, 'force': True}, body,
+                                    APPLY_PATCH_CONTENT_TYPE)
+            return codec.loads(await read_body(resp)), resp.status == 201
+        except client.ApiException as e:
+            if e.status != 415:
+                raise
+            _no_server_side_apply.add(api_client)
+
+    try:
+        resp = await call_async(api_client, 'PATCH', path, body=body, content_type=MERGE_PATCH_CONTENT_TYPE)
+        return codec.loads(await read_body(resp)), False
+    except client.ApiException as e:
+        if e.status != 404:
+            raise
+    resp = await call_async(api_client, 'POST', resource.path(namespace), body=body)
+    return codec.loads(await read_body(resp)), True
+
+
+async def apply_manifest(api_client, config_string, content, namespace=None):
+    result = manifest_result(content, namespace)
+    try:
+        resource = await resolve_async(api_client, result['kind'], content.get('apiVersion'))
+        if resource is None:
+            result.update(code=2404, msg=unsupported_kind(result['kind'], content.get('apiVersion'))['message'])
+            return result
+        if result['name'] is None or resource.namespaced and result['namespace'] is None:
+            result.update(code=2404, msg='metadata.name or namespace is None')
+            return result
+        ret, created, unchanged = await apply_object(api_client, config_string, resource, result['namespace'],
+                                                     result['name'], content)
+    except client.ApiException as e:
+        result.update(code=2999, msg=codec.loads(e.body))
+        return result
+    result.update(code=1000 if created else 1001, msg=apply_message(created, unchanged), unchanged=unchanged)
+    return result
+
+
+async def select_objects(api_client, resource, namespace, label_selector):
+    # 返回labelSelector匹配到的[(namespace, name)]
+    ret = await call_async(api_client, 'GET', resource.path(namespace), {'labelSelector': label_selector})
+    return [(item['metadata']['namespace'], item['metadata']['name'])
+            for item in codec.loads(await read_body(ret))['items']]
+
+
+async def scale_object(api_client, resource, namespace, name, replicas):
+    resp = await call_async(api_client, 'PATCH', resource.path(namespace, name, 'scale'),
+                            body={'spec': {'replicas': replicas}}, content_type=MERGE_PATCH_CONTENT_TYPE)
+    return codec.loads(await read_body(resp))
+
+
+async def scale_deployment(api_client, resource, namespace, name, replicas):
+    result = {'namespace': namespace, 'deployment': name}
+    try:
+        ret = await scale_object(api_client, resource, namespace, name, replicas)
+    except client.ApiException as e:
+        result.update(code=2998, msg=codec.loads(e.body))
+        return result
+    result.update(code=1001, msg='Modify succeed!!!', replicas=ret['spec']['replicas'])
+    return result
+
+
+async def list_pages(api_client, path, limit, **query):
+    # 按limit/continue分页读取，内存中同时只保留一页
+    _continue = None
+    while True:
+        resp = await call_async(api_client, 'GET', path, dict(query, limit=limit, **{'continue': _continue}))
+        page = codec.loads(await read_body(resp))
+        yield page
+        _continue = page['metadata'].get('continue')
+        if not _continue:
+            break
+
+
+def stream_list(api_client, path, params, error_code=2999, **query):
+    # 以NDJSON逐条输出列表中的对象，出错时最后一行为错误信息
+    tree = parse_fields(params.fields)
+
+    async def generate():
+        try:
+            async for page in list_pages(api_client, path, STREAM_PAGE_SIZE, **query):
+                for item in page.get('items') or []:
+                    yield codec.dumps(project(item, tree, params.managedFields)) + b'\n'
+        except client.ApiException as e:
+            yield codec.dumps({'code': error_code, 'msg': codec.loads(e.body)}) + b'\n'
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+async def init_cluster(configstring):
+    with instrument.stage('init_cluster'):
+        return await pool.get(configstring)
@@ -0,0 +1,77 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# apply去重: apply时把内容hash写进对象的annotation；再次apply相同内容时，线上对象的hash一致且仍包含这些字段才跳过写入
+# 进程内只记录本进程apply过的hash，用来决定是否值得先读一次线上对象，是否跳过始终以线上对象为准
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from app import metrics
+
+APPLY_SKIP_UNCHANGED = os.environ.get('K8S_APPLY_SKIP_UNCHANGED', '1') == '1'  # 内容未变化时是否跳过apply
+APPLIED_CACHE_SIZE = int(os.environ.get('K8S_APPLIED_CACHE_SIZE', '16384'))  # 最多记录的对象数，所有集群合计
+APPLIED_ANNOTATION = 'k8s-python/applied-hash'
+
+applies = metrics.Counter('k8s_apply_total', 'apply* calls by result', ['result'])
+
+
+def content_hash(body):
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def annotate(body, digest):
+    # 返回带上内容hash的副本，不修改调用方传入的body
+    metadata = dict(body.get('metadata') or {})
+    metadata['annotations'] = dict(metadata.get('annotations') or {}, **{APPLIED_ANNOTATION: digest})
+    return dict(body, metadata=metadata)
+
+
+def unchanged(live, body, digest):
+    # 线上对象最近一次由本服务apply的内容就是body(任何进程写入的hash都记录在对象上)，且之后没有被改掉
+    # 只看contains不够: 其他进程用同一个fieldManager apply过更多字段时，这些字段仍在线上，重新apply body会删除它们
+    annotations = (live.get('metadata') or {}).get('annotations') or {}
+    return annotations.get(APPLIED_ANNOTATION) == digest and contains(live, body)
+
+
+def contains(live, desired):
+    # desired中的每个字段在live中都存在且相等；列表逐项比较，live中API Server补上的默认值等字段忽略
+    if isinstance(desired, dict):
+        return isinstance(live, dict) and all(key in live and contains(live[key], value)
+                                              for key, value in desired.items())
+    if isinstance(desired, list):
+        return isinstance(live, list) and len(live) == len(desired) and all(map(contains, live, desired))
+    return live == desired
+
+
+def object_key(resource, namespace, name):
+    # 不含版本，同一对象通过不同版本apply时共用一条记录
+    return resource.group, resource.plural, namespace if resource.namespaced else None, name
+
+
+class AppliedCache:
+    """(集群kubeconfig指纹, 对象) -> 本进程最近一次apply的内容hash，LRU淘汰
+
+    按指纹而不是客户端记录，客户端被连接池按TTL淘汰重建后仍然有效；只在当前工作进程内有效，命中时才读线上对象判断能否跳过，
+    其他进程或客户端改过对象时由unchanged()发现并照常写入
+    """
+
+    def __init__(self, maxsize=APPLIED_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cluster, key):
+        with self._lock:
+            return self._entries.get((cluster, key))
+
+    def put(self, cluster, key, digest):
+        with self._lock:
+            self._entries[(cluster, key)] = digest
+            self._entries.move_to_end((cluster, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+applied = AppliedCache()
@@ -0,0 +1,42 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# JSON编解码: 安装了orjson时使用orjson，否则使用标准库json；JSONResponse可直接替换fastapi.responses.JSONResponse
+import json
+import os
+
+from fastapi.responses import JSONResponse as _JSONResponse
+
+from app import instrument
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖
+    orjson = None
+
+
+def _json_dumps(obj):
+    # 与starlette的JSONResponse输出格式一致
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+# 名称 -> (loads, dumps)，dumps返回bytes
+CODECS = {'json': (json.loads, _json_dumps)}
+if orjson is not None:
+    CODECS['orjson'] = (orjson.loads, _orjson_dumps)
+
+JSON_CODEC = os.environ.get('K8S_JSON_CODEC', 'orjson' if orjson is not None else 'json')  # JSON编解码库: orjson/json
+if JSON_CODEC not in CODECS:
+    raise RuntimeError(f'K8S_JSON_CODEC={JSON_CODEC} is not available, choose from {sorted(CODECS)}')
+
+loads, dumps = CODECS[JSON_CODEC]
+
+
+class JSONResponse(_JSONResponse):
+
+    def render(self, content):
+        with instrument.stage('serialize'):
+            return dumps(content)
@@ -0,0 +1,371 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# list+watch本地缓存: 每个(集群, 资源, namespace)一个后台线程维护内存中的对象，get*接口直接读内存
+# watch接口的订阅者也挂在informer上，多个订阅者共享同一个上游watch
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from app import codec, metrics
+from app.kube import client, watch
+from app.pool import fingerprint
+from app.resources import PLURALS, call, resolve
+from app.selector import LabelIndex, matches
+
+INFORMER_ENABLED = os.environ.get('K8S_INFORMER_CACHE', '0') == '1'  # 是否开启informer读缓存
+INFORMER_IDLE_TTL = float(os.environ.get('K8S_INFORMER_IDLE_TTL', '600'))  # 空闲多久后停止informer(秒)
+INFORMER_SYNC_TIMEOUT = float(os.environ.get('K8S_INFORMER_SYNC_TIMEOUT', '10'))  # 首次list的最长等待时间(秒)
+WATCH_TIMEOUT = int(os.environ.get('K8S_WATCH_TIMEOUT', '300'))  # 单次watch请求的服务端超时(秒)
+WATCH_HISTORY = int(os.environ.get('K8S_WATCH_HISTORY', '1000'))  # 每个informer保留的最近事件数，用于按resourceVersion续传
+WATCH_QUEUE_SIZE = int(os.environ.get('K8S_WATCH_QUEUE_SIZE', '1000'))  # 单个订阅者最多积压的事件数，超过后断开
+RETRY_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+watch_subscribers = metrics.Gauge('k8s_watch_subscribers', 'Clients subscribed to the /watch endpoint', ['resource'])
+watch_dropped = metrics.Counter('k8s_watch_dropped_total', 'Watch subscribers disconnected for falling behind',
+                                ['resource'])
+
+
+class Informer:
+
+    def __init__(self, api_client, resource, namespace):
+        self.api_client = api_client
+        self.kind = PLURALS[resource]
+        self.gvr = None  # 在后台线程中解析，多版本的kind需要查询discovery
+        self.resource = resource
+        self.namespace = namespace
+        self.objects = {}  # name -> object(dict)
+        self.index = LabelIndex()  # labelSelector查询使用的倒排索引
+        self.resource_version = None
+        self.error = None  # 首次list失败时的ApiException
+        self.last_access = time.monotonic()
+        self.history = deque(maxlen=WATCH_HISTORY)  # 最近的(事件, 事件前的对象)，订阅者按resourceVersion续传
+        self.subscribers = set()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name=f'informer-{self.resource}-{self.namespace}', daemon=True).start()
+        return self
+
+    def stop(self):
+        # 后台线程在收到下一个事件或本次watch超时后退出
+        self._stopped.set()
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def wait(self, timeout=INFORMER_SYNC_TIMEOUT):
+        self.last_access = time.monotonic()
+        if not self._synced.wait(timeout):
+            e = client.ApiException(status=504, reason='Timeout')
+            e.body = codec.dumps(status_body(504, 'Timeout', f'{self.resource} informer not synced'))
+            raise e
+        if self.error is not None:
+            raise self.error
+
+    def get(self, name):
+        self.wait()
+        return self.objects.get(name)
+
+    def list(self):
+        self.wait()
+        with self._lock:
+            return list(self.objects.values())
+
+    def select(self, requirements):
+        # requirements为app.selector.parse_selector的结果
+        if not requirements:
+            return self.list()
+        self.wait()
+        with self._lock:
+            return [self.objects[name] for name in sorted(self.index.select(requirements))]
+
+    def subscribe(self, subscription, resource_version=None):
+        # 不带resourceVersion时先推送当前全部对象的ADDED事件和一个BOOKMARK；带resourceVersion时补发其后的事件
+        self.wait()
+        with self._lock:
+            if not resource_version or resource_version == '0':
+                for item in self.objects.values():
+                    subscription.offer({'type': 'ADDED', 'object': item})
+                subscription.offer(bookmark(self.resource_version, {'k8s.io/initial-events-end': 'true'}))
+            else:
+                events = self._since(resource_version)
+                if events is None:
+                    e = client.ApiException(status=410, reason='Expired')
+                    e.body = codec.dumps(status_body(410, 'Expired', f'too old resource version: {resource_version}'))
+                    raise e
+                # 按续传点时的对象状态计算订阅者已看到的对象: 补发事件涉及的对象取其第一个事件之前的状态，其余取当前状态
+                before = {}
+                for event, prev in events:
+                    if event['type'] != 'BOOKMARK':
+                        before.setdefault(event['object']['metadata']['name'], prev)
+                state = dict(self.objects)
+                state.update(before)
+                subscription.names = {name for name, item in state.items()
+                                      if item is not None and
+                                      matches(subscription.requirements, item['metadata'].get('labels'))}
+                for event, _ in events:
+                    subscription.offer(event)
+            if subscription.closed:  # 异步接口在线程中订阅，订阅完成前客户端已断开
+                return subscription
+            self.subscribers.add(subscription)
+        watch_subscribers.inc(resource=self.resource)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscription.closed = True
+            if subscription not in self.subscribers:
+                return
+            self.subscribers.discard(subscription)
+        watch_subscribers.dec(resource=self.resource)
+        self.last_access = time.monotonic()
+
+    def close_subscribers(self, message):
+        # 进程退出前结束watch流和滚动更新等待，订阅者收到ERROR后可带上最后的id重连到其他实例
+        with self._lock:
+            for subscription in self.subscribers:
+                subscription.put({'type': 'ERROR', 'object': status_body(503, 'ServiceUnavailable', message)})
+
+    def _since(self, resource_version):
+        # resourceVersion之后的(事件, 事件前的对象)，已不在history中时返回None
+        if resource_version == self.resource_version:
+            return []
+        for i in range(len(self.history) - 1, -1, -1):
+            if self.history[i][0]['object']['metadata'].get('resourceVersion') == resource_version:
+                return list(self.history)[i + 1:]
+        return None
+
+    def _publish(self, event, prev=None):
+        # 调用方持有self._lock；prev为事件之前的对象
+        self.history.append((event, prev))
+        for subscription in list(self.subscribers):
+            if not subscription.offer(event):
+                self.subscribers.discard(subscription)
+                watch_subscribers.dec(resource=self.resource)
+                watch_dropped.inc(resource=self.resource)
+
+    def list_body(self, items):
+        return {'apiVersion': self.gvr.api_version, 'kind': self.kind + 'List',
+                'metadata': {'resourceVersion': self.resource_version}, 'items': items}
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                if self.gvr is None:
+                    self.gvr = resolve(self.api_client, self.kind)
+                if self.resource_version is None:
+                    self._list()
+                self._watch_once()
+            except client.ApiException as e:
+                if e.status == 410:  # resourceVersion过期，重新list
+                    self.resource_version = None
+                    continue
+                if not self._synced.is_set():
+                    self.error = e
+                    self._synced.set()
+                    self.stop()
+                    return
+                logger.warning('%s informer watch failed: %s', self.resource, e)
+                time.sleep(RETRY_INTERVAL)
+            except Exception as e:  # 网络中断等，稍后从当前resourceVersion继续watch
+                logger.warning('%s informer watch failed: %s', self.resource, e)
+                time.sleep(RETRY_INTERVAL)
+
+    def _list(self):
+        resp = call(self.api_client, 'GET', self.gvr.path(self.namespace))
+        body = codec.loads(resp.data)
+        objects = {item['metadata']['name']: item for item in body.get('items') or []}
+        with self._lock:
+            old, self.objects = self.objects, objects
+            self.index.clear()
+            for name, item in self.objects.items():
+                self.index.add(name, item['metadata'].get('labels'))
+            self.resource_version = body['metadata']['resourceVersion']
+            if self._synced.is_set():
+                self._publish_relist(old)
+        self._synced.set()
+
+    def _publish_relist(self, old):
+        # 重新list后把与之前的差异作为事件推送给订阅者
+        for name, item in self.objects.items():
+            prev = old.get(name)
+            if prev is None:
+                self._publish({'type': 'ADDED', 'object': item})
+            elif prev['metadata'].get('resourceVersion') != item['metadata'].get('resourceVersion'):
+                self._publish({'type': 'MODIFIED', 'object': item}, prev)
+        for name in old.keys() - self.objects.keys():
+            self._publish({'type': 'DELETED', 'object': old[name]}, old[name])
+        self._publish(bookmark(self.resource_version))
+
+    def _watch_once(self):
+        # 不使用kubernetes.watch.Watch: 其在deserialize=False时无法处理ERROR事件，这里直接按行解析原始事件
+        resp = call(self.api_client, 'GET', self.gvr.path(self.namespace),
+                    {'watch': True, 'resourceVersion': self.resource_version, 'allowWatchBookmarks': True,
+                     'timeoutSeconds': WATCH_TIMEOUT})
+        try:
+            for line in watch.iter_resp_lines(resp):
+                if self.stopped:
+                    break
+                if not line:
+                    continue
+                event = codec.loads(line)
+                obj = event['object']
+                if event['type'] == 'ERROR':
+                    raise client.ApiException(status=obj.get('code'), reason=obj.get('reason'))
+                with self._lock:
+                    name = obj['metadata'].get('name')
+                    prev = self.objects.get(name)
+                    if event['type'] in ('ADDED', 'MODIFIED'):
+                        self.objects[name] = obj
+                        self.index.add(name, obj['metadata'].get('labels'))
+                    elif event['type'] == 'DELETED':
+                        self.objects.pop(name, None)
+                        self.index.remove(name)
+                    self.resource_version = obj['metadata']['resourceVersion']
+                    self._publish(event, prev)
+        finally:
+            resp.close()
+            resp.release_conn()
+
+
+class InformerCache:
+
+    def __init__(self, idle_ttl=INFORMER_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._informers = {}  # (fingerprint, resource, namespace) -> Informer
+        self._lock = threading.Lock()
+        self._janitor = None
+
+    def get(self, config_string, api_client, resource, namespace):
+        key = (fingerprint(config_string), resource, namespace)
+        with self._lock:
+            informer = self._informers.get(key)
+            if informer is None or informer.stopped:
+                informer = self._informers[key] = Informer(api_client, resource, namespace).start()
+                self._start_janitor()
+        informer.last_access = time.monotonic()
+        return informer
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, informer in self._informers.items()
+                    if informer.stopped or (not informer.subscribers and now - informer.last_access > self.idle_ttl)]
+            for key in idle:
+                self._informers.pop(key).stop()
+        return len(idle)
+
+    def close_subscribers(self, message):
+        with self._lock:
+            active = list(self._informers.values())
+        for informer in active:
+            informer.close_subscribers(message)
+
+    def _start_janitor(self):
+        if self._janitor is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(min(self.idle_ttl, 60))
+                self.evict_idle()
+
+        self._janitor = threading.Thread(target=run, name='informer-janitor', daemon=True)
+        self._janitor.start()
+
+    def __len__(self):
+        return len(self._informers)
+
+
+class Subscription:
+    """watch接口的一个订阅者: 在informer线程中按labelSelector过滤事件后放入队列"""
+
+    def __init__(self, requirements, name=None):
+        self.requirements = requirements  # app.selector.parse_selector的结果
+        self.name = name  # 只关注该名称的对象
+        self.names = set()  # 已推送给订阅者且仍匹配的对象
+        self.queue = queue.Queue()
+        self.closed = False
+
+    def offer(self, event):
+        # 调用方持有informer的锁；积压过多时推送ERROR并返回False，informer随即移除该订阅者
+        if event['type'] != 'BOOKMARK':
+            obj = event['object']
+            name = obj['metadata'].get('name')
+            if self.name is not None and name != self.name:
+                return True
+            if event['type'] == 'DELETED':
+                if name not in self.names:
+                    return True
+                self.names.discard(name)
+            elif matches(self.requirements, obj['metadata'].get('labels')):
+                if name not in self.names:
+                    self.names.add(name)
+                    event = {'type': 'ADDED', 'object': obj}
+            elif name in self.names:  # 标签变化后不再匹配
+                self.names.discard(name)
+                event = {'type': 'DELETED', 'object': obj}
+            else:
+                return True
+        if self.qsize() >= WATCH_QUEUE_SIZE:
+            self.put({'type': 'ERROR', 'object': status_body(410, 'Expired',
+                                                             'watch subscriber fell behind, resume from the last id')})
+            return False
+        self.put(event)
+        return True
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def put(self, event):
+        self.queue.put(event)
+
+    def get(self, timeout):
+        # 超时返回None
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """异步接口使用: informer线程通过call_soon_threadsafe把事件交给事件循环"""
+
+    def __init__(self, requirements, loop, name=None):
+        super().__init__(requirements, name)
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def bookmark(resource_version, annotations=None):
+    metadata = {'resourceVersion': resource_version}
+    if annotations:
+        metadata['annotations'] = annotations
+    return {'type': 'BOOKMARK', 'object': {'kind': 'Bookmark', 'metadata': metadata}}
+
+
+def status_body(code, reason, message):
+    # 与API Server返回的Status响应体保持一致
+    return {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {}, 'status': 'Failure',
+            'message': message, 'reason': reason, 'code': code}
+
+
+informers = InformerCache()
@@ -0,0 +1,121 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 请求耗时埋点: 接口总耗时、各阶段耗时(init_cluster/序列化)、发往API Server的调用耗时
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from app import metrics
+from app.kube import client
+
+VERBS = {'POST': 'create', 'PUT': 'update', 'PATCH': 'patch', 'DELETE': 'delete'}
+
+http_seconds = metrics.Histogram('http_request_duration_seconds', 'HTTP request latency by endpoint',
+                                 ['endpoint', 'method', 'code'])
+http_in_flight = metrics.Gauge('http_requests_in_flight', 'HTTP requests currently being served', ['endpoint'])
+stage_seconds = metrics.Histogram('k8s_stage_duration_seconds', 'Latency of request processing stages', ['stage'])
+upstream_seconds = metrics.Histogram('k8s_upstream_duration_seconds',
+                                     'API server call latency until response headers, by verb and resource',
+                                     ['verb', 'resource', 'code'])
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+
+
+def verb_resource(method, url, query_params):
+    # 按kubernetes的verb统计: get/list/watch/create/update/patch/delete；resource含子资源，如deployments/scale
+    parts = urlsplit(url).path.strip('/').split('/')
+    rest = parts[2:] if parts[0] == 'api' else parts[3:]
+    if len(rest) > 2 and rest[0] == 'namespaces':
+        rest = rest[2:]
+    resource = rest[0] if rest else ''
+    if len(rest) > 2:
+        resource += '/' + rest[2]
+    if method == 'GET':
+        if len(rest) > 1:
+            return 'get', resource
+        watch = any(key == 'watch' and str(value).lower() == 'true' for key, value in query_params or ())
+        return 'watch' if watch else 'list', resource
+    return VERBS.get(method, method.lower()), resource
+
+
+def install(api_client):
+    # _preload_content=False时只统计到收到响应头
+    request = api_client.rest_client.request
+
+    def timed_request(method, url, query_params=None, *args, **kwargs):
+        start = time.perf_counter()
+        code = 0
+        try:
+            resp = request(method, url, query_params, *args, **kwargs)
+            code = resp.status
+            return resp
+        except client.ApiException as e:
+            code = e.status
+            raise
+        finally:
+            verb, resource = verb_resource(method, url, query_params)
+            upstream_seconds.observe(time.perf_counter() - start, verb=verb, resource=resource, code=code)
+
+    api_client.rest_client.request = timed_request
+    return api_client
+
+
+def install_async(api_client):
+    from kubernetes_asyncio.client.rest import ApiException as AsyncApiException  # 同步模式下不导入kubernetes_asyncio
+
+    request = api_client.rest_client.request
+
+    async def timed_request(method, url, query_params=None, *args, **kwargs):
+        start = time.perf_counter()
+        code = 0
+        try:
+            resp = await request(method, url, query_params, *args, **kwargs)
+            code = resp.status
+            return resp
+        except AsyncApiException as e:
+            code = e.status
+            raise
+        finally:
+            verb, resource = verb_resource(method, url, query_params)
+            upstream_seconds.observe(time.perf_counter() - start, verb=verb, resource=resource, code=code)
+
+    api_client.rest_client.request = timed_request
+    return api_client
+
+
+class MetricsMiddleware:
+    """ASGI中间件，统计每个接口的耗时与并发数；未注册的路径统一记为other，避免标签无限增长"""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+        self._paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self._paths is None:
+            self._paths = {getattr(route, 'path', None) for route in self.routes}
+        endpoint = scope['path'] if scope['path'] in self._paths else 'other'
+        code = 500
+
+        async def send_wrapper(message):
+            nonlocal code
+            if message['type'] == 'http.response.start':
+                code = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        http_in_flight.inc(endpoint=endpoint)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(endpoint=endpoint)
+            http_seconds.observe(time.perf_counter() - start, endpoint=endpoint, method=scope['method'], code=code)
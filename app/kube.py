@@ -0,0 +1,47 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 延迟导入kubernetes客户端: 导入kubernetes包会加载client下全部API类与数百个model模块(约0.3~0.6秒)
+# 推迟到第一次使用时，或由启动后的后台预热完成，进程可以更快开始监听
+import importlib
+import time
+
+from app import metrics
+
+import_seconds = metrics.Gauge('k8s_client_import_seconds', 'Time spent importing the kubernetes client modules',
+                               ['module'])
+
+
+class LazyModule:
+    """第一次访问属性时才导入的模块，用法与模块本身一致，如client.CoreV1Api、except client.ApiException"""
+
+    def __init__(self, name):
+        self.__name__ = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        return getattr(load(self), attr)
+
+    def __repr__(self):
+        return '<lazy module %r%s>' % (self.__name__, '' if self._module is None else ' (loaded)')
+
+
+def load(lazy):
+    # importlib自带按模块加锁，多个线程同时触发时只导入一次
+    if lazy._module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(lazy.__name__)
+        if lazy._module is None:
+            import_seconds.set(time.perf_counter() - start, module=lazy.__name__)
+            lazy._module = module
+    return lazy._module
+
+
+def preload(*modules):
+    for lazy in modules:
+        load(lazy)
+
+
+client = LazyModule('kubernetes.client')
+config = LazyModule('kubernetes.config')
+watch = LazyModule('kubernetes.watch.watch')
+urllib3 = LazyModule('urllib3')  # 同步客户端的底层HTTP库，如urllib3.exceptions.TimeoutError
@@ -0,0 +1,68 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 进程生命周期: 启动后在后台导入kubernetes客户端并预热已注册集群的客户端，/readyz与/livez探针使用的状态，
+# 收到SIGTERM后的摘流量状态
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metrics
+from app.kube import client, config, preload, watch
+from app.registry import registry
+
+WARMUP = os.environ.get('K8S_WARMUP', '1') == '1'  # 启动时是否为已注册集群创建客户端并建立连接
+WARMUP_TIMEOUT = float(os.environ.get('K8S_WARMUP_TIMEOUT', '10'))  # 预热单个集群的超时时间(秒)，失败不影响就绪
+WARMUP_CONCURRENCY = 16
+PRELOAD = os.environ.get('K8S_PRELOAD', '1') == '1'  # 启动后是否在后台导入kubernetes客户端，关闭时由第一个请求触发导入
+
+logger = logging.getLogger(__name__)
+
+startup_seconds = metrics.Gauge('app_startup_seconds', 'Seconds from loading the app until each startup phase finished',
+                                ['phase'])
+
+
+class Lifecycle:
+
+    def __init__(self):
+        self.ready = False  # 预热完成
+        self.draining = False  # 收到SIGTERM，不再接收新流量
+        self.started = time.perf_counter()
+
+    def mark(self, phase):
+        # 记录从开始导入应用到该阶段完成的耗时: app(应用初始化完成)、preload(客户端导入完成)、ready(可以接收流量)
+        elapsed = time.perf_counter() - self.started
+        startup_seconds.set(elapsed, phase=phase)
+        return elapsed
+
+    def readiness(self):
+        # 返回(是否就绪, 说明)
+        if self.draining:
+            return False, 'draining'
+        if not self.ready:
+            return False, 'warming up'
+        return True, 'ready'
+
+
+lifecycle = Lifecycle()
+
+
+def warm_up(get_client):
+    # 同步模式: 导入kubernetes客户端，从连接池创建客户端，并请求一次/version建立keep-alive连接
+    def warm_one(cluster_id):
+        try:
+            client.VersionApi(get_client(registry.get(cluster_id))).get_code(_preload_content=False,
+                                                                             _request_timeout=WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning('warm up cluster %s failed: %s', cluster_id, e)
+
+    if PRELOAD:
+        preload(client, config, watch)
+        lifecycle.mark('preload')
+    cluster_ids = registry.ids() if WARMUP else []
+    if cluster_ids:
+        with ThreadPoolExecutor(max_workers=min(len(cluster_ids), WARMUP_CONCURRENCY)) as executor:
+            list(executor.map(warm_one, cluster_ids))
+        logger.info('warmed up %d clusters', len(cluster_ids))
+    lifecycle.ready = True
+    logger.info('ready in %.2fs', lifecycle.mark('ready'))
@@ -1,20 +1,90 @@
 #!/bin/env python
 # -*- coding: utf-8 -*-
-import json
+import asyncio
+import functools
 import os
-import tempfile
-from typing import Optional
-
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from kubernetes import client, config
-from kubernetes.client.rest import ApiException
-from pydantic import BaseModel
-
-app = FastAPI()
-
-
-class Params(BaseModel):
+import re
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from fastapi import FastAPI, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, confloat, conint, root_validator, validator
+
+from app import codec, instrument, metrics
+from app.applied import APPLY_SKIP_UNCHANGED, annotate, applied, applies, content_hash, object_key, unchanged
+from app.codec import JSONResponse
+from app.informer import INFORMER_ENABLED, AsyncSubscription, informers, status_body
+from app.kube import client, urllib3
+from app.lifecycle import lifecycle, warm_up
+from app.pool import fingerprint, pool
+from app.projection import parse_fields, project, project_body, strip_managed_fields_raw
+from app.registry import ClusterConflict, is_admin, registry
+from app.resources import KINDS, MERGE_PATCH_CONTENT_TYPE, PLURALS, call, declared_version, resolve
+from app.rollout import ROLLOUT_TIMEOUT, RolloutWatcher
+from app.selector import parse_selector
+from app.singleflight import Group, read_key
+
+FIELD_MANAGER = os.environ.get('K8S_FIELD_MANAGER', 'k8s-python')  # server-side apply使用的fieldManager
+APPLY_PATCH_CONTENT_TYPE = 'application/apply-patch+yaml'
+THREAD_POOL_SIZE = int(os.environ.get('THREAD_POOL_SIZE', '64'))  # 同步接口的工作线程数
+STREAM_PAGE_SIZE = int(os.environ.get('STREAM_PAGE_SIZE', '500'))  # 流式输出时每页从API Server读取的数量
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))  # batchApply默认并发数
+SCALE_CONCURRENCY = int(os.environ.get('SCALE_CONCURRENCY', '16'))  # bulkScale默认并发数
+FANOUT_CONCURRENCY = int(os.environ.get('FANOUT_CONCURRENCY', '32'))  # fanoutQuery默认并发数
+FANOUT_TIMEOUT = float(os.environ.get('FANOUT_TIMEOUT', '10'))  # fanoutQuery单个集群的默认超时时间(秒)
+WATCH_HEARTBEAT = float(os.environ.get('K8S_WATCH_HEARTBEAT', '15'))  # watch接口没有事件时发送心跳的间隔(秒)
+
+# fanoutQuery支持的查询
+FANOUT_ACTIONS = ('getVirtualService', 'getDestinationRule', 'getDeployment', 'getService', 'getPods', 'getNameSpaces',
+                  'getNameSpace', 'getResource')
+# get*接口成功时的code，getNameSpaces/getNameSpace成功为0、失败为1000
+READ_SUCCESS_CODES = (1002, 0)
+# 滚动更新等待结果 -> 响应code
+ROLLOUT_CODES = {'done': 1008, 'failed': 2998, 'timeout': 2504}
+# ordered=true时按此顺序分批apply，同一批内并发执行，未列出的kind放在最后
+APPLY_ORDER = ['Namespace', 'ConfigMap', 'Service', 'Deployment', 'StatefulSet', 'HorizontalPodAutoscaler',
+               'DestinationRule', 'VirtualService']
+
+app = FastAPI(default_response_class=JSONResponse)
+app.add_middleware(instrument.MetricsMiddleware, routes=app.routes)
+
+_no_server_side_apply = weakref.WeakSet()  # 不支持server-side apply的集群客户端
+_ENVELOPE_CODE = re.compile(rb'^\{"code":(-?\d+)[,}]')
+
+
+@app.on_event("startup")
+async def init_thread_pool():
+    # 同步handler通过run_in_threadpool跑在事件循环的默认executor上，集群配置已按请求隔离，可按需扩大线程池
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE))
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    # 不阻塞启动，端口先开始监听，kubernetes客户端的导入与集群预热在后台线程中完成，完成前readyz返回503
+    lifecycle.mark('app')
+    asyncio.get_running_loop().run_in_executor(None, warm_up, init_cluster)
+
+
+class ClusterParams(BaseModel):
+    configString: Optional[str] = None
+    clusterId: Optional[str] = None  # 已注册集群的ID，与configString二选一
+
+    @root_validator(skip_on_failure=True)
+    def resolve_cluster(cls, values):
+        # 传clusterId时从注册表取出kubeconfig，handler中统一使用configString
+        if values.get('configString') is None:
+            if values.get('clusterId') is None:
+                raise ValueError('configString or clusterId is required')
+            values['configString'] = registry.get(values['clusterId'])
+            if values['configString'] is None:
+                raise ValueError(f"cluster {values['clusterId']} is not registered")
+        return values
+
+
+class Params(ClusterParams):
     hpa: Optional[str] = None
     destination: Optional[str] = None
     virtualService: Optional[str] = None
@@ -23,440 +93,824 @@ class Params(BaseModel):
     replicas: Optional[int] = None
     labelSelector: Optional[str] = None
     namespace: str
-    configString: str
     content: Optional[dict] = None
+    limit: Optional[int] = None  # 列表接口分页大小
+    continue_: Optional[str] = Field(None, alias='continue')  # 上一页返回的metadata.continue
+    stream: bool = False  # 列表接口以NDJSON逐条输出
+    fields: Optional[List[str]] = None  # get*接口只返回指定字段，如["metadata.name", "status.phase"]
+    managedFields: bool = False  # get*接口是否保留metadata.managedFields
+    wait: bool = False  # applyDeployment/modifyDeployment后等待滚动更新完成再返回
+    timeout: Optional[float] = None  # 等待滚动更新的最长时间(秒)
+    requestTimeout: Optional[confloat(gt=0)] = None  # get*接口单次API请求的超时(秒)，fanoutQuery按集群超时设置
+    kind: Optional[str] = None  # getResource/delResource的资源类型，如ConfigMap
+    apiVersion: Optional[str] = None  # 指定读写的版本；kind未登记在KINDS中时必填，如gateway.networking.k8s.io/v1
+    name: Optional[str] = None  # getResource/delResource的资源名称
 
+    class Config:
+        allow_population_by_field_name = True
 
-@app.post("/applyhpa")  # 更新hpa信息
-def applyhpa(params: Params):
-    namespace = params.namespace
-    hpa = params.hpa
-    content = params.content
+    @validator('fields')
+    def check_fields(cls, v):
+        parse_fields(v)
+        return v
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
 
-    v1 = client.CustomObjectsApi()
-    # 先获取dr资源是否存在，如果不存在则进行create，如果存在则进行patch
-    try:
-        v1.get_namespaced_custom_object(group="autoscaling", version="v2beta2", plural="horizontalpodautoscalers",
-                                        namespace=namespace, name=hpa)
-    except ApiException:
-        try:
-            ret = v1.create_namespaced_custom_object(group="autoscaling", version="v2beta2",
-                                                     plural="horizontalpodautoscalers", namespace=namespace, body=content)
-
-            return JSONResponse(content={'code': 1000, 'msg': 'Create succeed!!!',
-                                         'data': ret if isinstance(ret, dict) else json.loads(ret)})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    else:
-        try:
-            ret = v1.patch_namespaced_custom_object(group="autoscaling", version="v2beta2",
-                                                    plural="horizontalpodautoscalers", name=hpa, namespace=namespace,
-                                                    body=content)
-            return JSONResponse(content={'code': 1001, 'msg': 'Update succeed!!!',
-                                         'data': ret if isinstance(ret, dict) else json.loads(ret)})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+class BatchParams(ClusterParams):
+    namespace: Optional[str] = None  # manifest未指定metadata.namespace时使用
+    items: List[dict]
+    concurrency: Optional[conint(ge=1)] = None
+    ordered: bool = False
 
 
-@app.post("/applyService")  # 更新Service信息
-def applyService(params: Params):
-    namespace = params.namespace
-    service = params.service
-    content = params.content
+class Cluster(ClusterParams):
+    name: Optional[str] = None  # 结果中标识集群，默认使用clusterId或下标
+
+
+class RegisterParams(BaseModel):
+    configString: str
+    clusterId: Optional[str] = None  # 不指定时根据kubeconfig生成
+    overwrite: bool = False  # clusterId已注册为其他kubeconfig时是否替换，需要携带K8S_CLUSTER_ADMIN_TOKEN
+
+
+class UnregisterParams(BaseModel):
+    clusterId: str
+
+
+class ScaleItem(BaseModel):
+    namespace: Optional[str] = None  # 默认使用BulkScaleParams.namespace
+    deployment: str
+    replicas: int
+
+
+class BulkScaleParams(ClusterParams):
+    namespace: Optional[str] = None
+    items: List[ScaleItem] = []
+    labelSelector: Optional[str] = None  # 同时修改匹配的全部Deployment，未指定namespace时在所有namespace中查找
+    replicas: Optional[int] = None  # labelSelector匹配到的Deployment使用的副本数
+    concurrency: Optional[conint(ge=1)] = None
+    wait: bool = False  # 等待全部Deployment滚动更新完成再返回
+    timeout: Optional[float] = None  # 等待滚动更新的最长时间(秒)
+
+    @root_validator(skip_on_failure=True)
+    def check_targets(cls, values):
+        if not values['items'] and values['labelSelector'] is None:
+            raise ValueError('items or labelSelector is required')
+        if values['labelSelector'] is not None and values['replicas'] is None:
+            raise ValueError('replicas is required with labelSelector')
+        if values['namespace'] is None and any(item.namespace is None for item in values['items']):
+            raise ValueError('namespace is required')
+        return values
+
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+class FanoutParams(BaseModel):
+    clusters: List[Cluster] = Field(..., min_items=1)
+    action: str  # 在每个集群上执行的查询，如getPods
+    query: dict  # 查询参数，与对应接口的参数相同(不含configString/clusterId)
+    timeout: Optional[confloat(gt=0)] = None
+    concurrency: Optional[conint(ge=1)] = None
 
-    k8s_core_v1 = client.CoreV1Api()
-    # 先查询是否有对应资源，如果不存在做异常处理，进行创建。如果存在则进行更新
+    @validator('action')
+    def check_action(cls, v):
+        if v not in FANOUT_ACTIONS:
+            raise ValueError(f'unsupported action, choose from {FANOUT_ACTIONS}')
+        return v
+
+    @validator('query')
+    def check_query(cls, v):
+        Params(**dict(v, configString=''))
+        return v
+
+
+class WatchParams(ClusterParams):
+    resource: str  # KINDS中登记的资源名(plural)，如pods/deployments/virtualservices
+    namespace: str
+    labelSelector: Optional[str] = None
+    resourceVersion: Optional[str] = None  # 从该版本之后续传，不传时先推送当前全部对象
+    fields: Optional[List[str]] = None
+    managedFields: bool = False
+
+    @validator('resource')
+    def check_resource(cls, v):
+        if v not in PLURALS:
+            raise ValueError(f'unsupported resource, choose from {sorted(PLURALS)}')
+        return v
+
+    @validator('labelSelector')
+    def check_selector(cls, v):
+        parse_selector(v)
+        return v
+
+    @validator('fields')
+    def check_fields(cls, v):
+        parse_fields(v)
+        return v
+
+
+def read_succeeded(response):
+    # 只缓存成功的get*响应，404/5xx等错误不缓存，否则刚创建的对象在TTL内仍返回不存在
+    # 响应信封的第一个字段总是code，只解析开头
+    match = _ENVELOPE_CODE.match(response.body)
+    return response.status_code == 200 and match is not None and int(match.group(1)) in READ_SUCCESS_CODES
+
+
+reads = Group(cacheable=read_succeeded)
+
+
+def coalesce(handler):
+    # 相同的并发get*请求共享一次上游调用，流式输出不合并
+    @functools.wraps(handler)
+    def wrapper(params: Params):
+        if params.stream:
+            return handler(params)
+        return reads.do(read_key(handler.__name__, params), lambda: handler(params))
+
+    return wrapper
+
+
+@app.post("/applyhpa")  # 更新hpa信息
+def applyhpa(params: Params):
+    if params.content is None:
+        return content_required()
     try:
-        k8s_core_v1.read_namespaced_service(name=service, namespace=namespace)
-    except ApiException:
-        try:
-            ret = k8s_core_v1.create_namespaced_service(body=content, namespace=namespace)
-            return JSONResponse(content={'code': 1000, 'msg': f'{ret.metadata.name} Create succeed!!!'})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body.decode("UTF-8"))})
-    else:
-        ret = k8s_core_v1.patch_namespaced_service(name=service, body=content, namespace=namespace)
-        return JSONResponse(content={'code': 1001, 'msg': f'{ret.metadata.name} Update succeed!!!'})
-    finally:
-        os.remove(config_file)
+        ret, created, unchanged = apply_resource(params, 'HorizontalPodAutoscaler', params.hpa)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001, 'msg': apply_message(created, unchanged),
+                                 'unchanged': unchanged, 'data': ret})
 
 
-@app.post("/applyDeployment")  # 更新Deployment信息
-def applyDeployment(params: Params):
-    namespace = params.namespace
-    deployment = params.deployment
-    content = params.content
+@app.post("/applyService")  # 更新Service信息
+def applyService(params: Params):
+    if params.content is None:
+        return content_required()
+    try:
+        ret, created, unchanged = apply_resource(params, 'Service', params.service)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001,
+                                 'msg': f'{ret["metadata"]["name"]} {apply_message(created, unchanged)}',
+                                 'unchanged': unchanged})
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
 
-    k8s_apps_v1 = client.AppsV1Api()
+@app.post("/applyDeployment")  # 更新Deployment信息
+async def applyDeployment(params: Params):
+    # apply在工作线程中执行，wait=true时在事件循环上等待滚动更新，等待期间不占用工作线程
+    if params.content is None:
+        return content_required()
     try:
-        k8s_apps_v1.read_namespaced_deployment(name=deployment, namespace=namespace)
-    except ApiException:
-        try:
-            ret = k8s_apps_v1.create_namespaced_deployment(body=content, namespace=namespace)
-            return JSONResponse(content={'code': 1000, 'msg': f'{ret.metadata.name} Create succeed!!!'})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    else:
-        ret = k8s_apps_v1.patch_namespaced_deployment(name=deployment, body=content, namespace=namespace)
-        return JSONResponse(content={'code': 1001, 'msg': f'{ret.metadata.name} Update succeed!!!'})
-    finally:
-        os.remove(config_file)
+        ret, created, unchanged = await run_in_threadpool(apply_resource, params, 'Deployment', params.deployment)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    result = {'code': 1000 if created else 1001,
+              'msg': f'{ret["metadata"]["name"]} {apply_message(created, unchanged)}', 'unchanged': unchanged}
+    if params.wait:
+        result['rollout'] = await wait_rollout(params.configString, params.namespace, ret['metadata']['name'],
+                                               params.timeout, generation=ret['metadata'].get('generation'))
+    return JSONResponse(content=result)
 
 
 @app.post("/applyVirtualService")  # 更新VirtualService信息
 def applyVirtualService(params: Params):
-    namespace = params.namespace
-    virtual_service = params.virtualService
-    content = params.content
-
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
-
-    v1 = client.CustomObjectsApi()
-    # 先获取dr资源是否存在，如果不存在则进行create，如果存在则进行patch
+    if params.content is None:
+        return content_required()
     try:
-        v1.get_namespaced_custom_object(group="networking.istio.io", version="v1alpha3", plural="virtualservices",
-                                        namespace=namespace, name=virtual_service)
-    except ApiException:
-        try:
-            ret = v1.create_namespaced_custom_object(group="networking.istio.io", version="v1beta1",
-                                                     plural="virtualservices", namespace=namespace, body=content)
-
-            return JSONResponse(content={'code': 1000, 'msg': 'Create succeed!!!',
-                                         'data': ret if isinstance(ret, dict) else json.loads(ret)})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    else:
-        try:
-            ret = v1.patch_namespaced_custom_object(group="networking.istio.io", version="v1beta1",
-                                                    plural="virtualservices", name=virtual_service, namespace=namespace,
-                                                    body=content)
-            return JSONResponse(content={'code': 1001, 'msg': 'Update succeed!!!',
-                                         'data': ret if isinstance(ret, dict) else json.loads(ret)})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+        ret, created, unchanged = apply_resource(params, 'VirtualService', params.virtualService)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001, 'msg': apply_message(created, unchanged),
+                                 'unchanged': unchanged, 'data': ret})
 
 
 @app.post("/applyDestinationRule")  # 更新DestinationRule信息
 def applyDestinationRule(params: Params):
-    namespace = params.namespace
-    destination = params.destination
-    content = params.content
+    if params.content is None:
+        return content_required()
+    try:
+        ret, created, unchanged = apply_resource(params, 'DestinationRule', params.destination)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1000 if created else 1001, 'msg': apply_message(created, unchanged),
+                                 'unchanged': unchanged, 'data': ret})
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
 
-    v1 = client.CustomObjectsApi()
-    # 先获取dr资源是否存在，如果不存在则进行create，如果存在则进行patch
-    try:
-        v1.get_namespaced_custom_object(group="networking.istio.io", version="v1alpha3",
-                                        plural="destinationrules", namespace=namespace,
-                                        name=destination)  # 获取dr资源是否存在
-    except ApiException:
-        try:
-            ret = v1.create_namespaced_custom_object(group="networking.istio.io", version="v1beta1",
-                                                     plural="destinationrules", namespace=namespace, body=content)
-            return JSONResponse(content={'code': 1000, 'msg': 'Create succeed!!!',
-                                         'data': ret if isinstance(ret, dict) else json.loads(ret)})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    else:
-        try:
-            ret = v1.patch_namespaced_custom_object(group="networking.istio.io", version="v1beta1",
-                                                    plural="destinationrules", name=destination, namespace=namespace,
-                                                    body=content)
-            return JSONResponse(content={'code': 1001, 'msg': 'Update succeed!!!',
-                                         'data': ret if isinstance(ret, dict) else json.loads(ret)})
-        except ApiException as e:
-            return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+@app.post("/applyResource")  # apply任意kind的资源，kind/apiVersion/metadata取自content，结果与batchApply中的一项相同
+def applyResource(params: Params):
+    if params.content is None:
+        return content_required()
+    api_client = init_cluster(params.configString)  # 从连接池获取集群客户端
+    return JSONResponse(content=apply_manifest(api_client, params.configString, params.content, params.namespace))
 
 
-@app.post("/getVirtualService")  # 获取VirtualService信息
-def getVirtualService(params: Params):
-    namespace = params.namespace
-    virtual_service = params.virtualService
+@app.post("/batchApply")  # 批量apply多种资源
+def batchApply(params: BatchParams):
+    api_client = init_cluster(params.configString)  # 从连接池获取集群客户端
+
+    results = [None] * len(params.items)
+    with ThreadPoolExecutor(max_workers=params.concurrency or BATCH_CONCURRENCY) as executor:
+        for stage in apply_stages(params.items, params.ordered):
+            rets = executor.map(lambda i: apply_manifest(api_client, params.configString, params.items[i],
+                                                         params.namespace), stage)
+            for i, ret in zip(stage, rets):
+                results[i] = ret
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+    return JSONResponse(content={'code': 1005, 'msg': 'Batch apply finished!!!', 'data': results})
 
-    v1 = client.CustomObjectsApi()
+
+@app.post("/registerCluster")  # 注册集群，之后的请求可以用clusterId代替configString
+def registerCluster(params: RegisterParams, authorization: Optional[str] = Header(None)):
+    if params.overwrite and not is_admin(authorization):
+        return JSONResponse(content={'code': 2403, 'msg': 'Forbidden'})
     try:
-        if virtual_service is not None:
-            ret = v1.get_namespaced_custom_object(group="networking.istio.io", version="v1alpha3",
-                                                  plural="virtualservices", namespace=namespace, name=virtual_service)
-        else:
-            ret = v1.list_namespaced_custom_object(group="networking.istio.io", version="v1alpha3",
-                                                   plural="virtualservices",
-                                                   namespace=namespace)  # 如果没有指定资源名称，则输出获取到的全部资源列表
+        init_cluster(params.configString)  # 校验kubeconfig并预热客户端
+        cluster_id = registry.register(params.configString, params.clusterId, params.overwrite)
+    except ClusterConflict as e:
+        return JSONResponse(content={'code': 2409, 'msg': str(e)})
+    except Exception as e:
+        return JSONResponse(content={'code': 2400, 'msg': str(e)})
+    return JSONResponse(content={'code': 1000, 'msg': 'Register succeed!!!', 'data': {'clusterId': cluster_id}})
 
-        return JSONResponse(content={'code': 1002, 'msg': ret if isinstance(ret, dict) else json.loads(ret)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
 
+@app.delete("/unregisterCluster")  # 需要携带K8S_CLUSTER_ADMIN_TOKEN
+def unregisterCluster(params: UnregisterParams, authorization: Optional[str] = Header(None)):
+    if not is_admin(authorization):
+        return JSONResponse(content={'code': 2403, 'msg': 'Forbidden'})
+    config_string = registry.unregister(params.clusterId)
+    if config_string is None:
+        return JSONResponse(content={'code': 2404, 'msg': f'Cluster {params.clusterId} is not registered'})
+    pool.evict(config_string)
+    return JSONResponse(content={'code': 1004, 'msg': 'Success'})
 
-@app.post("/getDestinationRule")  # 获取DestinationRule信息
-def getDestinationRule(params: Params):
-    namespace = params.namespace
-    destination = params.destination
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+@app.get("/getClusters")  # 已注册的集群ID，需要携带K8S_CLUSTER_ADMIN_TOKEN
+def getClusters(authorization: Optional[str] = Header(None)):
+    return clusters_response(authorization)
 
-    v1 = client.CustomObjectsApi()
-    try:
-        if destination is not None:
-            ret = v1.get_namespaced_custom_object(group="networking.istio.io", version="v1alpha3",
-                                                  plural="destinationrules", namespace=namespace, name=destination)
-        else:
-            ret = v1.list_namespaced_custom_object(group="networking.istio.io", version="v1alpha3",
-                                                   plural="destinationrules",
-                                                   namespace=namespace)  # 如果没有指定资源名称，则输出获取到的全部资源列表
-        return JSONResponse(content={'code': 1002, 'msg': ret if isinstance(ret, dict) else json.loads(ret)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
 
+@app.get("/metrics")
+def getMetrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-@app.post("/getDeployment")  # 获取Deployment信息
-def getDeployment(params: Params):
-    namespace = params.namespace
-    deployment = params.deployment
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+@app.get("/livez")  # 存活探针，async handler不占用工作线程，线程池繁忙时也能响应
+async def livez():
+    return JSONResponse(content={'code': 1002, 'msg': 'alive'})
 
-    k8s_apps_v1 = client.AppsV1Api()
-    try:
-        ret = k8s_apps_v1.read_namespaced_deployment(name=deployment, namespace=namespace,
-                                                     _preload_content=False).read()
 
-        return JSONResponse(content={'code': 1002, 'msg': ret if isinstance(ret, dict) else json.loads(ret)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+@app.get("/readyz")  # 就绪探针，预热完成前和收到SIGTERM后返回503
+async def readyz():
+    return readiness_response()
 
 
-@app.post("/getService")  # 获取Service信息
-def getService(params: Params):
-    namespace = params.namespace
-    service = params.service
+@app.post("/getVirtualService")  # 获取VirtualService信息
+@coalesce
+def getVirtualService(params: Params):
+    return read_resource(params, 'VirtualService', params.virtualService)
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
 
-    k8s_core_v1 = client.CoreV1Api()
-    try:
-        ret = k8s_core_v1.read_namespaced_service(name=service, namespace=namespace, _preload_content=False).read()
+@app.post("/getDestinationRule")  # 获取DestinationRule信息
+@coalesce
+def getDestinationRule(params: Params):
+    return read_resource(params, 'DestinationRule', params.destination)
 
-        return JSONResponse(content={'code': 1002, 'msg': ret if isinstance(ret, dict) else json.loads(ret)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
 
+@app.post("/getDeployment")  # 获取Deployment信息
+@coalesce
+def getDeployment(params: Params):
+    if params.deployment is None:
+        return name_required('Deployment')
+    return read_resource(params, 'Deployment', params.deployment)
 
-@app.post("/getPods")
-def getPods(params: Params):
-    namespace = params.namespace
-    # deployment = params.deployment
-    label_selector = params.labelSelector
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+@app.post("/getService")  # 获取Service信息
+@coalesce
+def getService(params: Params):
+    if params.service is None:
+        return name_required('Service')
+    return read_resource(params, 'Service', params.service)
 
-    core_v1 = client.CoreV1Api()
-    try:
-        ret = core_v1.list_namespaced_pod(namespace=namespace, label_selector=label_selector, watch=False,
-                                          _preload_content=False).read()
-        return JSONResponse(content={'code': 1002, 'msg': ret if isinstance(ret, dict) else json.loads(ret)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2999, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+
+@app.post("/getPods")
+@coalesce
+def getPods(params: Params):
+    return read_resource(params, 'Pod')
 
 
 @app.post("/getNameSpaces")
+@coalesce
 def getNameSpaces(params: Params):
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+    return read_resource(params, 'Namespace', key='data', error_code=1000, code=0, msg='')
 
-    core_v1 = client.CoreV1Api()
 
-    try:
-        res = core_v1.list_namespace(_preload_content=False).read()
+@app.post("/getNameSpace")
+@coalesce
+def getNameSpace(params: Params):
+    return read_resource(params, 'Namespace', params.namespace, key='data', error_code=1000, code=0, msg='')
 
-        return JSONResponse(content={'code': 0, 'msg': '', 'data': res if isinstance(res, dict) else json.loads(res)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 1000, 'msg': json.loads(e.body), 'data': None})
-    finally:
-        os.remove(config_file)
 
+@app.post("/getResource")  # 获取任意kind的资源，kind未登记在KINDS中时需要指定apiVersion
+@coalesce
+def getResource(params: Params):
+    return read_resource(params, params.kind, params.name)
 
-@app.post("/getNameSpace")
-def getNameSpace(params: Params):
-    namespace, configString = params
 
-    conf_file = init_cluster(configString)  # 加载集群认证配置信息
+@app.delete("/delhpa")
+def delhpa(params: Params):
+    return delete_resource(params, 'HorizontalPodAutoscaler', params.hpa)
 
-    core_v1 = client.CoreV1Api()
 
-    try:
-        res = core_v1.read_namespace(name=namespace, _preload_content=False).read()
+@app.delete("/delDestinationRule")
+def delDestinationRule(params: Params):
+    return delete_resource(params, 'DestinationRule', params.destination)
 
-        return JSONResponse(content={'code': 0, 'msg': '', 'data': res if isinstance(res, dict) else json.loads(res)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 1000, 'msg': json.loads(e.body), 'data': None})
-    finally:
-        os.remove(conf_file)
 
+@app.delete("/delVirtualService")
+def delVirtualService(params: Params):
+    return delete_resource(params, 'VirtualService', params.virtualService)
 
-@app.delete("/delhpa")
-def delhpa(params: Params):
-    namespace = params.namespace
-    hpa = params.hpa
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+@app.delete("/delDeployment")
+def delDeployment(params: Params):
+    return delete_resource(params, 'Deployment', params.deployment, msg='Success')
 
-    v1 = client.CustomObjectsApi()
-    try:
-        ret = getDestinationRule(params)
-        if ret.status_code == 200:
-            res = v1.delete_namespaced_custom_object(group="autoscaling", version="v2beta2",
-                                                     plural="horizontalpodautoscalers", namespace=namespace, name=hpa)
-            return JSONResponse(content={'code': 1004, 'msg': res if isinstance(res, dict) else json.loads(res)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2998, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
 
+@app.delete("/delService")
+def delService(params: Params):
+    return delete_resource(params, 'Service', params.service, msg='Success')
 
-@app.delete("/delDestinationRule")
-def delDestinationRule(params: Params):
+
+@app.delete("/delResource")  # 删除任意kind的资源
+def delResource(params: Params):
+    return delete_resource(params, params.kind, params.name)
+
+
+@app.post("/modifyDeployment")
+async def modifyDeployment(params: Params):
     namespace = params.namespace
-    destination = params.destination
+    deployment = params.deployment
+
+    api_client = await run_in_threadpool(init_cluster, params.configString)  # 从连接池获取集群客户端
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+    try:
+        resource = await run_in_threadpool(resolve, api_client, 'Deployment')
+        ret = await run_in_threadpool(scale_object, api_client, resource, namespace, deployment, params.replicas)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2998, 'msg': codec.loads(e.body)})
+    replicas = ret['spec']['replicas']
+    result = {'code': 1001, 'msg': 'Modify succeed!!!', 'data': {'name': deployment, 'replicas': replicas}}
+    if params.wait:
+        result['rollout'] = await wait_rollout(params.configString, namespace, deployment, params.timeout,
+                                               replicas=replicas)
+    return JSONResponse(content=result)
+
+
+@app.post("/bulkScale")  # 批量修改Deployment副本数
+async def bulkScale(params: BulkScaleParams):
+    try:
+        results = await run_in_threadpool(bulk_scale, params)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    if params.wait:
+        await wait_rollouts(params, [result for result in results if result['code'] == 1001])
+    return JSONResponse(content={'code': 1007, 'msg': 'Bulk scale finished!!!', 'data': results})
+
+
+@app.post("/fanoutQuery")  # 在多个集群上并发执行同一个查询
+async def fanoutQuery(params: FanoutParams):
+    # 与app.aio一致: 最多concurrency个集群同时查询，每个集群的超时从它开始查询时计算，排队时间不计入
+    handler = FANOUT_HANDLERS[params.action]
+    timeout = params.timeout or FANOUT_TIMEOUT
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(params.concurrency or FANOUT_CONCURRENCY)
+    # 超时的查询无法中断，上游请求也带上同样的超时，线程随后退出，不占用并发名额，也不占用公共线程池
+    executor = ThreadPoolExecutor(max_workers=len(params.clusters))
+
+    async def query(i, cluster):
+        name = cluster.name or cluster.clusterId or str(i)
+        async with semaphore:
+            try:
+                ret = await asyncio.wait_for(loop.run_in_executor(executor, handler,
+                                                                    cluster_params(params, cluster, timeout)), timeout)
+            except asyncio.TimeoutError:
+                return codec.dumps({'cluster': name, 'code': 2504, 'msg': f'Timeout after {timeout}s'})
+            except Exception as e:
+                if isinstance(e, urllib3.exceptions.TimeoutError):  # 上游请求先于wait_for超时
+                    return codec.dumps({'cluster': name, 'code': 2504, 'msg': f'Timeout after {timeout}s'})
+                return codec.dumps({'cluster': name, 'code': 2500, 'msg': str(e)})
+        return cluster_result(name, ret.body)
 
-    v1 = client.CustomObjectsApi()
     try:
-        ret = getDestinationRule(params)
-        if ret.status_code == 200:
-            res = v1.delete_namespaced_custom_object(group="networking.istio.io", version="v1alpha3",
-                                                     plural="destinationrules", namespace=namespace, name=destination)
-            return JSONResponse(content={'code': 1004, 'msg': res if isinstance(res, dict) else json.loads(res)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2998, 'msg': json.loads(e.body)})
+        results = await asyncio.gather(*[query(i, cluster) for i, cluster in enumerate(params.clusters)])
     finally:
-        os.remove(config_file)
+        executor.shutdown(wait=False)
+    return raw_response(b'[%s]' % b','.join(results), key='data', code=1006, msg='Fanout finished!!!')
 
 
-@app.delete("/delVirtualService")
-def delVirtualService(params: Params):
-    namespace = params.namespace
-    virtual_service = params.virtualService
+@app.post("/waitRollout")  # 等待Deployment滚动更新完成，代替轮询getDeployment
+async def waitRollout(params: Params):
+    if params.deployment is None:
+        return JSONResponse(content={'code': 2999, 'msg': status_body(400, 'BadRequest', 'deployment is required')})
+    return JSONResponse(content=rollout_response(await wait_rollout(params.configString, params.namespace,
+                                                                    params.deployment, params.timeout)))
+
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
+@app.post("/watch")  # 以Server-Sent Events推送资源变化，同一集群/资源/namespace的订阅者共享一个上游watch
+async def watch(params: WatchParams, last_event_id: Optional[str] = Header(None)):
+    # 长连接在事件循环上等待事件，不占用工作线程，订阅者再多也不影响其他接口
+    loop = asyncio.get_running_loop()
+    api_client = await loop.run_in_executor(None, init_cluster, params.configString)
+    informer = informers.get(params.configString, api_client, params.resource, params.namespace)
+    subscription = AsyncSubscription(parse_selector(params.labelSelector), loop)
+    tree = parse_fields(params.fields)
+
+    async def generate():
+        try:
+            try:
+                # 首次订阅需要等待informer完成list
+                await loop.run_in_executor(None, informer.subscribe, subscription,
+                                           params.resourceVersion or last_event_id)
+            except client.ApiException as e:
+                yield sse_event({'type': 'ERROR', 'object': codec.loads(e.body)})
+                return
+            while True:
+                event = await subscription.get(WATCH_HEARTBEAT)
+                if event is None:
+                    yield b': heartbeat\n\n'
+                    continue
+                yield sse_event(event, tree, params.managedFields)
+                if event['type'] == 'ERROR':
+                    return
+        finally:
+            informer.unsubscribe(subscription)
+
+    return watch_response(generate())
+
+
+FANOUT_HANDLERS = {
+    'getVirtualService': getVirtualService,
+    'getDestinationRule': getDestinationRule,
+    'getDeployment': getDeployment,
+    'getService': getService,
+    'getPods': getPods,
+    'getNameSpaces': getNameSpaces,
+    'getNameSpace': getNameSpace,
+    'getResource': getResource,
+}
+
+
+def read_resource(params, kind, name=None, key='msg', error_code=2999, **fields):
+    # get*接口的通用实现: 指定name时读取单个对象，否则按labelSelector/limit/continue列出或流式输出
+    # fields为成功时响应信封中的其他字段，默认{'code': 1002}
+    fields = fields or {'code': 1002}
+    api_client = init_cluster(params.configString)  # 从连接池获取集群客户端
+    if informer_readable(params, kind):
+        return informer_get(params, api_client, KINDS[kind][2], name)
 
-    v1 = client.CustomObjectsApi()
     try:
-        ret = getVirtualService(params)
-        if ret.status_code == 200:
-            res = v1.delete_namespaced_custom_object(group="networking.istio.io", version="v1alpha3",
-                                                     plural="virtualservices", namespace=namespace,
-                                                     name=virtual_service)
-            return JSONResponse(content={'code': 1004, 'msg': json.loads(res)})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2998, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+        resource = resolve(api_client, kind, params.apiVersion)
+        if resource is None:
+            return error_response(unsupported_kind(kind, params.apiVersion), key, error_code)
+        if name is not None:
+            ret = call(api_client, 'GET', resource.path(params.namespace, name), timeout=params.requestTimeout).data
+        elif params.stream:
+            return stream_list(api_client, resource.path(params.namespace), params, error_code,
+                               labelSelector=params.labelSelector)
+        else:
+            ret = call(api_client, 'GET', resource.path(params.namespace),
+                       {'labelSelector': params.labelSelector, 'limit': params.limit,
+                        'continue': params.continue_},
+                       timeout=params.requestTimeout).data  # 如果没有指定资源名称，则输出获取到的全部资源列表
+        return read_response(ret, params, key, **fields)
+    except client.ApiException as e:
+        return error_response(codec.loads(e.body), key, error_code)
+
+
+def apply_resource(params, kind, name):
+    # apply*接口的通用实现，返回(对象dict, 是否新建, 是否跳过)；content中声明了同一group的apiVersion时按该版本写入
+    api_client = init_cluster(params.configString)  # 从连接池获取集群客户端
+    resource = resolve(api_client, kind, declared_version(kind, params.content))
+    return apply_object(api_client, params.configString, resource, params.namespace, name, params.content)
+
+
+def delete_resource(params, kind, name, msg=None):
+    # del*接口的通用实现，msg为None时返回API Server的响应(Status或被删除的对象)
+    if name is None:
+        return name_required(kind)
+    api_client = init_cluster(params.configString)  # 从连接池获取集群客户端
+    try:
+        resource = resolve(api_client, kind, params.apiVersion)
+        if resource is None:
+            return JSONResponse(content={'code': 2404, 'msg': unsupported_kind(kind, params.apiVersion)})
+        res = codec.loads(call(api_client, 'DELETE', resource.path(params.namespace, name)).data)
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2998, 'msg': codec.loads(e.body)})
+    return JSONResponse(content={'code': 1004, 'msg': res if msg is None else msg})
+
+
+def apply_object(api_client, config_string, resource, namespace, name, body):
+    # 返回(对象dict, 是否新建, 是否因内容未变化跳过)，响应不反序列化为model，直接解析json
+    cluster, key, digest = fingerprint(config_string), object_key(resource, namespace, name), content_hash(body)
+    if APPLY_SKIP_UNCHANGED and applied.get(cluster, key) == digest:
+        # 与本进程上次apply的内容相同时读一次线上对象，对象上记录的hash一致且期间没有被改动才跳过，读请求比写请求便宜得多
+        try:
+            live = codec.loads(call(api_client, 'GET', resource.path(namespace, name)).data)
+        except client.ApiException as e:
+            if e.status != 404:
+                raise
+            live = None
+        if live is not None and unchanged(live, body, digest):
+            applies.inc(result='unchanged')
+            return live, False, True
+    ret, created = server_side_apply(api_client, resource, namespace, name, annotate(body, digest))
+    applied.put(cluster, key, digest)
+    applies.inc(result='created' if created else 'updated')
+    return ret, created, False
+
+
+def server_side_apply(api_client, resource, namespace, name, body):
+    # 一次PATCH完成创建或更新(server-side apply)，返回(对象dict, 是否新建)
+    path = resource.path(namespace, name)
+    if api_client not in _no_server_side_apply:
+        try:
+            resp = call(api_client, 'PATCH', path, {'fieldManager': FIELD_MANAGER, 'force': True}, body,
+                        APPLY_PATCH_CONTENT_TYPE)
+            return codec.loads(resp.data), resp.status == 201
+        except client.ApiException as e:
+            if e.status != 415:
+                raise
+            _no_server_side_apply.add(api_client)  # 老版本API Server不支持apply-patch，之后直接走兼容逻辑
+
+    # 兼容逻辑: 先patch，资源不存在时再create
+    try:
+        resp = call(api_client, 'PATCH', path, body=body, content_type=MERGE_PATCH_CONTENT_TYPE)
+        return codec.loads(resp.data), False
+    except client.ApiException as e:
+        if e.status != 404:
+            raise
+    return codec.loads(call(api_client, 'POST', resource.path(namespace), body=body).data), True
 
 
-@app.delete("/delDeployment")
-def delDeployment(params: Params):
-    namespace = params.namespace
-    deployment = params.deployment
+def apply_message(created, unchanged):
+    if unchanged:
+        return 'Unchanged, apply skipped!!!'
+    return 'Create succeed!!!' if created else 'Update succeed!!!'
+
+
+def unsupported_kind(kind, api_version=None):
+    return status_body(404, 'NotFound', f'Unsupported kind {api_version}/{kind}' if api_version else
+                       f'Unsupported kind {kind}')
+
+
+def name_required(kind):
+    return JSONResponse(content={'code': 2404, 'msg': f'{kind}Name is None'})
+
+
+def content_required():
+    return JSONResponse(content={'code': 2404, 'msg': 'content is None'})
+
+
+def error_response(msg, key='msg', code=2999):
+    # get*接口的错误信封，数据不在msg中时数据字段为null
+    content = {'code': code, 'msg': msg}
+    if key != 'msg':
+        content[key] = None
+    return JSONResponse(content=content)
+
+
+def apply_stages(items, ordered):
+    # 返回按批次分组的下标列表
+    if not ordered:
+        return [list(range(len(items)))]
+    stages = {}
+    for i, item in enumerate(items):
+        kind = item.get('kind')
+        stages.setdefault(APPLY_ORDER.index(kind) if kind in APPLY_ORDER else len(APPLY_ORDER), []).append(i)
+    return [stages[rank] for rank in sorted(stages)]
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
 
-    k8s_apps_v1 = client.AppsV1Api()
-    if deployment is None:
-        return JSONResponse(content={'code': 2404, 'msg': 'DeploymentName is None'})
+def manifest_result(content, namespace):
+    metadata = content.get('metadata') or {}
+    return {'kind': content.get('kind'), 'name': metadata.get('name'),
+            'namespace': metadata.get('namespace') or namespace}
+
+
+def apply_manifest(api_client, config_string, content, namespace=None):
+    # kind/apiVersion登记在KINDS中时直接使用，否则通过discovery查找，任意kind都可以apply
+    result = manifest_result(content, namespace)
     try:
-        # ret = getDeployment(params)
-        # if ret.status_code == 200:
-        res = k8s_apps_v1.delete_namespaced_deployment(name=deployment, namespace=namespace)
-        if res.status != 'Success':  # 不知道为什么在容器中res.status拿到的值都是None
-            return JSONResponse(content={'code': 1004, 'msg': 'Success'})
-        else:
-            return JSONResponse(content={'code': 1004, 'msg': res.status})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2998, 'msg': json.loads(e.body)})
+        resource = resolve(api_client, result['kind'], content.get('apiVersion'))
+        if resource is None:
+            result.update(code=2404, msg=unsupported_kind(result['kind'], content.get('apiVersion'))['message'])
+            return result
+        if result['name'] is None or resource.namespaced and result['namespace'] is None:
+            result.update(code=2404, msg='metadata.name or namespace is None')
+            return result
+        ret, created, unchanged = apply_object(api_client, config_string, resource, result['namespace'], result['name'],
+                                               content)
+    except client.ApiException as e:
+        result.update(code=2999, msg=codec.loads(e.body))
+        return result
+    result.update(code=1000 if created else 1001, msg=apply_message(created, unchanged), unchanged=unchanged)
+    return result
+
+
+def scale_targets(params, selected):
+    # 返回[(namespace, deployment, replicas)]，items中显式指定的副本数优先于labelSelector
+    targets = {}
+    for item in params.items:
+        targets[(item.namespace or params.namespace, item.deployment)] = item.replicas
+    for key in selected:
+        targets.setdefault(key, params.replicas)
+    return [(namespace, name, replicas) for (namespace, name), replicas in targets.items()]
+
+
+def select_objects(api_client, resource, namespace, label_selector):
+    # 返回labelSelector匹配到的[(namespace, name)]，namespace为None时在所有namespace中查找
+    ret = call(api_client, 'GET', resource.path(namespace), {'labelSelector': label_selector})
+    return [(item['metadata']['namespace'], item['metadata']['name']) for item in codec.loads(ret.data)['items']]
+
+
+def scale_object(api_client, resource, namespace, name, replicas):
+    # 通过scale子资源修改副本数，返回Scale对象
+    return codec.loads(call(api_client, 'PATCH', resource.path(namespace, name, 'scale'),
+                            body={'spec': {'replicas': replicas}}, content_type=MERGE_PATCH_CONTENT_TYPE).data)
+
+
+def bulk_scale(params):
+    # 并发修改副本数，返回每个Deployment的结果；labelSelector查询失败时抛出ApiException
+    api_client = init_cluster(params.configString)  # 从连接池获取集群客户端
+    resource = resolve(api_client, 'Deployment')
+    selected = []
+    if params.labelSelector is not None:
+        selected = select_objects(api_client, resource, params.namespace, params.labelSelector)
+
+    with ThreadPoolExecutor(max_workers=params.concurrency or SCALE_CONCURRENCY) as executor:
+        return list(executor.map(lambda target: scale_deployment(api_client, resource, *target),
+                                 scale_targets(params, selected)))
+
+
+def scale_deployment(api_client, resource, namespace, name, replicas):
+    result = {'namespace': namespace, 'deployment': name}
+    try:
+        ret = scale_object(api_client, resource, namespace, name, replicas)
+    except client.ApiException as e:
+        result.update(code=2998, msg=codec.loads(e.body))
+        return result
+    result.update(code=1001, msg='Modify succeed!!!', replicas=ret['spec']['replicas'])
+    return result
+
+
+async def wait_rollout(config_string, namespace, name, timeout=None, generation=None, replicas=None, deadline=None):
+    # 订阅deployments informer直到滚动更新完成、失败或超时，同一namespace的等待共享一个上游watch
+    # informer在后台线程中运行，事件通过AsyncSubscription交给事件循环，等待期间不占用工作线程
+    loop = asyncio.get_running_loop()
+    timeout = timeout or ROLLOUT_TIMEOUT
+    api_client = await loop.run_in_executor(None, init_cluster, config_string)
+    informer = informers.get(config_string, api_client, 'deployments', namespace)
+    subscription = AsyncSubscription([], loop, name=name)
+    watcher = RolloutWatcher(name, generation, replicas)
+    deadline = deadline or loop.time() + timeout
+    try:
+        await loop.run_in_executor(None, informer.subscribe, subscription)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return watcher.timeout(timeout)
+            event = await subscription.get(remaining)
+            result = None if event is None else watcher.feed(event)
+            if result is not None:
+                return result
+    except client.ApiException as e:
+        return watcher.result('failed', codec.loads(e.body).get('message'))
     finally:
-        os.remove(config_file)
+        informer.unsubscribe(subscription)
 
 
-@app.delete("/delService")
-def delService(params: Params):
-    namespace = params.namespace
-    service = params.service
+async def wait_rollouts(params, scaled):
+    # bulkScale等待全部Deployment，最多params.concurrency个同时订阅，共用一个截止时间，结果写入result['rollout']
+    loop = asyncio.get_running_loop()
+    timeout = params.timeout or ROLLOUT_TIMEOUT
+    deadline = loop.time() + timeout
+    semaphore = asyncio.Semaphore(params.concurrency or SCALE_CONCURRENCY)
+
+    async def wait_one(result):
+        async with semaphore:
+            result['rollout'] = await wait_rollout(params.configString, result['namespace'], result['deployment'],
+                                                   timeout, replicas=result['replicas'], deadline=deadline)
+
+    await asyncio.gather(*[wait_one(result) for result in scaled])
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
 
-    k8s_core_v1 = client.CoreV1Api()
-    if service is None:
-        return JSONResponse(content={'code': 2404, 'msg': 'ServiceName is None'})
+def rollout_response(result):
+    return {'code': ROLLOUT_CODES[result['status']], 'msg': result['message'], 'data': result}
+
+
+def informer_get(params, api_client, resource, name=None):
+    # 从informer本地缓存读取，name为None时按labelSelector返回List
+    informer = informers.get(params.configString, api_client, resource, params.namespace)
     try:
-        # ret = getService(params)
-        # if ret.status_code == 200:
-        res = k8s_core_v1.delete_namespaced_service(name=service, namespace=namespace)
-        if res.status != 'Success':  # 不知道为什么在容器中res.status拿到的值都是None
-            return JSONResponse(content={'code': 1004, 'msg': 'Success'})
+        if name is not None:
+            ret = informer.get(name)
+            if ret is None:
+                return JSONResponse(content={'code': 2999, 'msg': status_body(404, 'NotFound',
+                                                                               f'{resource} "{name}" not found')})
         else:
-            return JSONResponse(content={'code': 1004, 'msg': res.status})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2998, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+            ret = informer.list_body(informer.select(parse_selector(params.labelSelector)))
+    except client.ApiException as e:
+        return JSONResponse(content={'code': 2999, 'msg': codec.loads(e.body)})
+    except ValueError as e:
+        return JSONResponse(content={'code': 2999, 'msg': status_body(400, 'BadRequest', str(e))})
+    return JSONResponse(content={'code': 1002, 'msg': project_body(ret, parse_fields(params.fields),
+                                                                    params.managedFields)})
 
 
-@app.post("/modifyDeployment")
-def modifyDeployment(params: Params):
-    replicas_body = {'spec': {'replicas': params.replicas}}
-    namespace = params.namespace
-    deployment = params.deployment
+def informer_readable(params, kind):
+    # 开启informer缓存时，登记在KINDS中的namespaced资源按默认版本读取且不分页时从informer读
+    return INFORMER_ENABLED and kind in KINDS and KINDS[kind][3] and params.apiVersion is None and not paged(params)
 
-    config_file = init_cluster(params.configString)  # 加载集群认证配置信息
 
-    k8s_apps_v1 = client.AppsV1Api()
-    try:
-        ret = k8s_apps_v1.patch_namespaced_deployment_scale(name=deployment, namespace=namespace, body=replicas_body)
-        return JSONResponse(content={'code': 1001, 'msg': 'Modify succeed!!!',
-                                     'data': {'name': deployment, 'replicas': ret.spec.replicas}})
-    except ApiException as e:
-        return JSONResponse(content={'code': 2998, 'msg': json.loads(e.body)})
-    finally:
-        os.remove(config_file)
+def paged(params):
+    return params.stream or params.limit is not None or params.continue_ is not None
 
 
-def init_cluster(configstring):
-    config_file = create_temp_file(configstring)
-    config.load_kube_config(config_file=config_file)
+def list_pages(api_client, path, limit, **query):
+    # 按limit/continue分页读取，内存中同时只保留一页
+    _continue = None
+    while True:
+        page = codec.loads(call(api_client, 'GET', path, dict(query, limit=limit, **{'continue': _continue})).data)
+        yield page
+        _continue = page['metadata'].get('continue')
+        if not _continue:
+            break
+
+
+def stream_list(api_client, path, params, error_code=2999, **query):
+    # 以NDJSON逐条输出列表中的对象，出错时最后一行为错误信息
+    tree = parse_fields(params.fields)
+
+    def generate():
+        try:
+            for page in list_pages(api_client, path, STREAM_PAGE_SIZE, **query):
+                for item in page.get('items') or []:
+                    yield codec.dumps(project(item, tree, params.managedFields)) + b'\n'
+        except client.ApiException as e:
+            yield codec.dumps({'code': error_code, 'msg': codec.loads(e.body)}) + b'\n'
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+def clusters_response(authorization):
+    if not is_admin(authorization):
+        return JSONResponse(content={'code': 2403, 'msg': 'Forbidden'})
+    return JSONResponse(content={'code': 1002, 'msg': registry.ids()})
 
-    return config_file
 
+def readiness_response():
+    ready, msg = lifecycle.readiness()
+    return JSONResponse(status_code=200 if ready else 503, content={'code': 1002 if ready else 2503, 'msg': msg})
 
-def create_temp_file(content=""):
-    handler, name = tempfile.mkstemp()
 
-    os.write(handler, str.encode(content))
-    os.close(handler)
+def sse_event(event, tree=None, managed_fields=False):
+    # id为resourceVersion，EventSource断线重连时通过Last-Event-ID请求头带回，从该版本续传
+    obj = event['object']
+    if event['type'] not in ('BOOKMARK', 'ERROR'):
+        obj = project(obj, tree, managed_fields)
+    resource_version = event['object'].get('metadata', {}).get('resourceVersion')
+    head = b'id: %s\n' % resource_version.encode() if resource_version else b''
+    return b'%sevent: %s\ndata: %s\n\n' % (head, event['type'].encode(), codec.dumps(obj))
 
-    return name
+
+def watch_response(events):
+    # 关闭反向代理的缓冲，事件到达后立即发给客户端
+    return StreamingResponse(events, media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def raw_response(raw, key='msg', **fields):
+    # 把API Server返回的JSON字节原样拼进响应信封，不做解析和重新序列化
+    head = codec.dumps(fields)[:-1]
+    return Response(content=b'%s,"%s":%s}' % (head, key.encode(), raw), media_type='application/json')
+
+
+def read_response(raw, params, key='msg', **fields):
+    # 按params.fields裁剪并去掉managedFields；不需要裁剪字段时在原始字节上去掉managedFields后拼接，不解析响应
+    if not params.fields:
+        body = raw if params.managedFields else strip_managed_fields_raw(raw)
+        if body is not None:
+            return raw_response(body, key, **fields)
+    fields[key] = project_body(codec.loads(raw), parse_fields(params.fields), params.managedFields)
+    return JSONResponse(content=fields)
+
+
+def cluster_params(params, cluster, timeout):
+    # 单个集群的查询参数，fanout结果需要合并，不支持流式输出；上游请求的超时与该集群的超时一致
+    return Params(**dict(params.query, configString=cluster.configString, stream=False, requestTimeout=timeout))
+
+
+def cluster_result(name, body):
+    # 在单集群响应信封的开头加上cluster字段，不重新解析响应体
+    return b'{"cluster":%s,%s' % (codec.dumps(name), body[1:])
+
+
+def init_cluster(configstring):
+    with instrument.stage('init_cluster'):
+        return pool.get(configstring)
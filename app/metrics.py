@@ -0,0 +1,118 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# Prometheus文本格式的指标: Counter/Gauge/Histogram，不依赖prometheus_client
+import bisect
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []  # 按注册顺序输出
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label值tuple -> 值
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = [(key, self._copy(value)) for key, value in sorted(self._values.items())]
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _copy(self, value):
+        return value
+
+    def _samples(self, key, value):
+        return [f'{self.name}{self._labels(key)} {_format(value)}']
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]  # [各桶计数(最后一个为+Inf), 总和]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def _copy(self, value):
+        return list(value[0]), value[1]
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{self._labels(key, [("le", _format(bound))])} {cumulative}')
+        lines.append(f'{self.name}_sum{self._labels(key)} {_format(total)}')
+        lines.append(f'{self.name}_count{self._labels(key)} {cumulative}')
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
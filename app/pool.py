@@ -0,0 +1,123 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+import atexit
+import functools
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import yaml
+
+from app import instrument, metrics, ratelimit
+from app.kube import client, config
+
+POOL_SIZE = int(os.environ.get('K8S_CLIENT_POOL_SIZE', '32'))  # 最多缓存的集群客户端数量
+POOL_TTL = float(os.environ.get('K8S_CLIENT_POOL_TTL', '600'))  # 客户端过期时间(秒)
+CERT_CACHE_DIR = os.environ.get('K8S_CERT_CACHE_DIR', '')  # 集群证书缓存目录，为空时每个进程使用自己的临时目录
+CONNECTION_POOL_MAXSIZE = int(os.environ.get('K8S_CONNECTION_POOL_MAXSIZE', '64'))  # 每个集群的最大keep-alive连接数
+
+pool_requests = metrics.Counter('k8s_client_pool_requests_total', 'Cluster client lookups by result', ['result'])
+
+
+def fingerprint(config_string):
+    return hashlib.sha256(config_string.encode('utf-8')).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def cert_dir():
+    # CA和客户端证书写入的目录必须只有当前用户可访问，否则其他用户可以预先创建该目录并替换其中的证书
+    if not CERT_CACHE_DIR:
+        path = tempfile.mkdtemp(prefix='k8s-python-certs-')  # 第一次加载集群时创建，多进程部署时每个工作进程各自一个
+        atexit.register(shutil.rmtree, path, True)
+        return path
+    os.makedirs(CERT_CACHE_DIR, mode=0o700, exist_ok=True)
+    st = os.lstat(CERT_CACHE_DIR)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f'K8S_CERT_CACHE_DIR={CERT_CACHE_DIR} must be a directory owned by the current user '
+                           f'with mode 0700')
+    return CERT_CACHE_DIR
+
+
+class ClientPool:
+    """按 kubeconfig 指纹缓存 ApiClient，LRU + TTL 淘汰，复用 keep-alive 连接"""
+
+    def __init__(self, loader, maxsize=POOL_SIZE, ttl=POOL_TTL):
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clients = OrderedDict()  # fingerprint -> (ApiClient, 创建时间)
+        self._lock = threading.Lock()
+        self._building = {}  # fingerprint -> Lock，同一集群并发未命中时只加载一次
+
+    def _lookup(self, key):
+        entry = self._clients.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            self._clients.move_to_end(key)
+            return entry[0]
+        return None
+
+    def get(self, config_string):
+        key = fingerprint(config_string)
+        with self._lock:
+            api_client = self._lookup(key)
+            if api_client is not None:
+                self.hits += 1
+                pool_requests.inc(result='hit')
+                return api_client
+            self.misses += 1
+            pool_requests.inc(result='miss')
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                api_client = self._lookup(key)
+            if api_client is not None:
+                return api_client
+
+            with instrument.stage('load_client'):  # 解析kubeconfig并创建客户端
+                api_client = self.loader(config_string)
+
+            with self._lock:
+                self._clients[key] = (api_client, time.monotonic())
+                self._clients.move_to_end(key)
+                self._building.pop(key, None)
+                while len(self._clients) > self.maxsize:
+                    # 被淘汰的客户端可能仍被其他请求借用，不主动关闭，交给GC回收
+                    self._clients.popitem(last=False)
+        return api_client
+
+    def evict(self, config_string):
+        with self._lock:
+            return self._clients.pop(fingerprint(config_string), None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+def load_client(config_string):
+    # 每个集群使用独立的Configuration，不修改全局默认配置，多线程并发访问不同集群时互不影响
+    configuration = client.Configuration()
+    configuration.connection_pool_maxsize = CONNECTION_POOL_MAXSIZE
+    configuration.retries = False  # 关闭urllib3自带的重试(不带抖动)，429只由ratelimit重试
+
+    # 直接在内存中解析kubeconfig，证书数据只在首次加载时写入该集群固定的缓存目录
+    config.load_kube_config_from_dict(yaml.safe_load(config_string), client_configuration=configuration,
+                                      persist_config=False,
+                                      temp_file_path=os.path.join(cert_dir(), fingerprint(config_string)))
+
+    return ratelimit.install(instrument.install(client.ApiClient(configuration=configuration)),
+                             fingerprint(config_string))
+
+
+pool = ClientPool(load_client)
@@ -0,0 +1,112 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# get*接口的字段裁剪: fields为类JSONPath的字段列表，如 ["metadata.name", "spec.template.spec.containers[*].image"]
+import re
+
+from app import codec
+
+_SEGMENT = re.compile(r'^([^.\[\]]+)(\[\*?\])?$')
+_MANAGED_FIELDS = re.compile(rb'"managedFields"\s*:\s*\[')
+_SPACE = re.compile(rb'\s*')
+
+
+def parse_fields(fields):
+    # 把字段列表解析成嵌套dict，叶子为True表示保留整个子树；未指定字段时返回None
+    if not fields:
+        return None
+    tree = {}
+    for field in fields:
+        path = field.strip().strip('{}').lstrip('$').lstrip('.')
+        if not path:
+            raise ValueError(f'invalid field: {field!r}')
+        node = tree
+        segments = path.split('.')
+        for i, segment in enumerate(segments):
+            m = _SEGMENT.match(segment)
+            if m is None:
+                raise ValueError(f'invalid field: {field!r}')
+            key = m.group(1)
+            if i == len(segments) - 1:
+                node[key] = True
+                break
+            child = node.setdefault(key, {})
+            if child is True:  # 已经保留了整个父字段
+                break
+            node = child
+    return tree
+
+
+def project(obj, tree, managed_fields=False):
+    # 返回裁剪后的新对象，不修改obj(informer缓存中的对象会被多个请求共享)
+    if not managed_fields:
+        obj = strip_managed_fields(obj)
+    if tree is None:
+        return obj
+    return _select(obj, tree)
+
+
+def project_body(body, tree, managed_fields=False):
+    # List响应保留apiVersion/kind/metadata，只裁剪items中的每个对象
+    if isinstance(body.get('items'), list) and str(body.get('kind', '')).endswith('List'):
+        return dict(body, items=[project(item, tree, managed_fields) for item in body['items']])
+    return project(body, tree, managed_fields)
+
+
+def strip_managed_fields(obj):
+    metadata = obj.get('metadata')
+    if not isinstance(metadata, dict) or 'managedFields' not in metadata:
+        return obj
+    return dict(obj, metadata={k: v for k, v in metadata.items() if k != 'managedFields'})
+
+
+def strip_managed_fields_raw(raw):
+    # 直接在API Server返回的字节上删除metadata.managedFields，不解析整个响应；无法确定时返回None，由调用方解析后裁剪
+    if b'"managedFields"' not in raw:
+        return raw
+    chunks = []
+    pos = 0
+    for m in _MANAGED_FIELDS.finditer(raw):
+        start = m.start()
+        i = start
+        while i > 0 and raw[i - 1] == 0x5c:
+            i -= 1
+        if (start - i) % 2:  # 字符串中转义的引号，如last-applied-configuration注解
+            continue
+        end, entries = _array_end(raw, m.end() - 1)
+        if end < 0 or not all(isinstance(entry, dict) and 'manager' in entry for entry in entries):
+            return None  # 不是ManagedFieldsEntry列表
+        # 连同前面或后面的逗号一起删除
+        head = raw[pos:start].rstrip()
+        if head.endswith(b','):
+            chunks.append(head[:-1])
+        else:
+            chunks.append(raw[pos:start])
+            i = _SPACE.match(raw, end).end()
+            if raw[i:i + 1] == b',':
+                end = i + 1
+        pos = end
+    chunks.append(raw[pos:])
+    return b''.join(chunks)
+
+
+def _array_end(raw, start):
+    # raw[start]为'['，返回匹配的']'之后的位置和解析出的列表；字符串中的']'使解析失败，继续找下一个
+    end = start
+    while True:
+        end = raw.find(b']', end + 1)
+        if end < 0:
+            return -1, None
+        try:
+            return end + 1, codec.loads(raw[start:end + 1])
+        except ValueError:
+            continue
+
+
+def _select(value, tree):
+    if tree is True:
+        return value
+    if isinstance(value, list):  # 列表字段自动展开，containers.image 与 containers[*].image 等价
+        return [_select(v, tree) for v in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: _select(value[key], sub) for key, sub in tree.items() if key in value}
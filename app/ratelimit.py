@@ -0,0 +1,149 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 每个集群一组令牌桶(读/写分开)，限制发往API Server的请求速率；遇到429时按Retry-After加随机抖动重试
+# 通过替换ApiClient.rest_client.request生效，覆盖handler、informer、watch等全部调用
+import asyncio
+import os
+import random
+import threading
+import time
+
+from app import metrics
+from app.kube import client
+
+READ_QPS = float(os.environ.get('K8S_READ_QPS', '100'))  # 每个集群读请求的速率(个/秒)，0为不限速
+READ_BURST = int(os.environ.get('K8S_READ_BURST', '200'))  # 每个集群读请求的突发上限
+WRITE_QPS = float(os.environ.get('K8S_WRITE_QPS', '30'))  # 每个集群写请求的速率(个/秒)，0为不限速
+WRITE_BURST = int(os.environ.get('K8S_WRITE_BURST', '60'))  # 每个集群写请求的突发上限
+THROTTLE_RETRIES = int(os.environ.get('K8S_THROTTLE_RETRIES', '3'))  # 429的最大重试次数
+THROTTLE_BACKOFF = float(os.environ.get('K8S_THROTTLE_BACKOFF', '0.5'))  # 没有Retry-After时的初始退避时间(秒)
+THROTTLE_MAX_WAIT = float(os.environ.get('K8S_THROTTLE_MAX_WAIT', '30'))  # 单次重试的最长等待时间(秒)
+WORKERS = int(os.environ.get('WORKERS', '1'))  # 工作进程数(app.serve)，每个进程的令牌桶按进程数均分集群的限额
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+wait_seconds = metrics.Histogram('k8s_ratelimit_wait_seconds', 'Time spent queueing for a rate limiter token',
+                                 ['kind'], buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+waiting = metrics.Gauge('k8s_ratelimit_waiting', 'Requests currently queueing for a rate limiter token', ['kind'])
+throttled = metrics.Counter('k8s_throttled_total', 'API server responses with status 429', ['kind'])
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # 取走一个令牌并返回使用前需要等待的时间；令牌不足时预支，排队的请求按到达顺序依次放行
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ClusterLimiter:
+
+    def __init__(self, read_qps=READ_QPS / WORKERS, read_burst=max(READ_BURST // WORKERS, 1),
+                 write_qps=WRITE_QPS / WORKERS, write_burst=max(WRITE_BURST // WORKERS, 1)):
+        self.read = TokenBucket(read_qps, read_burst)
+        self.write = TokenBucket(write_qps, write_burst)
+
+    def reserve(self, method):
+        # 返回(读/写, 需要等待的时间)
+        if method.upper() in READ_METHODS:
+            return 'read', self.read.reserve()
+        return 'write', self.write.reserve()
+
+
+_limiters = {}  # 集群指纹 -> ClusterLimiter，客户端被连接池淘汰重建后仍使用同一组令牌桶
+_lock = threading.Lock()
+
+
+def get_limiter(key):
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = ClusterLimiter()
+        return limiter
+
+
+def retry_delay(retry_after, attempt):
+    # API Server的优先级与公平性(APF)拒绝请求时会返回429和Retry-After，没有时按指数退避；都加上随机抖动，避免同时重试
+    try:
+        delay = float(retry_after)
+    except (TypeError, ValueError):
+        delay = THROTTLE_BACKOFF * 2 ** attempt
+    return min(delay + random.uniform(0, max(delay, THROTTLE_BACKOFF) / 2), THROTTLE_MAX_WAIT)
+
+
+def install(api_client, key):
+    # 同步客户端: rest_client.request在非2xx时抛出ApiException
+    limiter = get_limiter(key)
+    request = api_client.rest_client.request
+
+    def limited_request(method, url, *args, **kwargs):
+        for attempt in range(THROTTLE_RETRIES + 1):
+            kind, delay = limiter.reserve(method)
+            wait_seconds.observe(delay, kind=kind)
+            if delay > 0:
+                waiting.inc(kind=kind)
+                time.sleep(delay)
+                waiting.dec(kind=kind)
+            try:
+                return request(method, url, *args, **kwargs)
+            except client.ApiException as e:
+                if e.status != 429:
+                    raise
+                throttled.inc(kind=kind)
+                if attempt == THROTTLE_RETRIES:
+                    raise
+                time.sleep(retry_delay((e.headers or {}).get('Retry-After'), attempt))
+
+    api_client.rest_client.request = limited_request
+    return api_client
+
+
+def install_async(api_client, key):
+    # kubernetes_asyncio: _preload_content=False时不检查状态码，需要自己判断429
+    from kubernetes_asyncio.client.rest import ApiException as AsyncApiException  # 同步模式下不导入kubernetes_asyncio
+
+    limiter = get_limiter(key)
+    request = api_client.rest_client.request
+
+    async def limited_request(method, url, *args, **kwargs):
+        for attempt in range(THROTTLE_RETRIES + 1):
+            kind, delay = limiter.reserve(method)
+            wait_seconds.observe(delay, kind=kind)
+            if delay > 0:
+                waiting.inc(kind=kind)
+                await asyncio.sleep(delay)
+                waiting.dec(kind=kind)
+            try:
+                resp = await request(method, url, *args, **kwargs)
+            except AsyncApiException as e:
+                if e.status != 429:
+                    raise
+                throttled.inc(kind=kind)
+                if attempt == THROTTLE_RETRIES:
+                    raise
+                retry_after = (e.headers or {}).get('Retry-After')
+            else:
+                if resp.status != 429:
+                    return resp
+                throttled.inc(kind=kind)
+                if attempt == THROTTLE_RETRIES:
+                    return resp
+                retry_after = resp.headers.get('Retry-After')
+                resp.release()
+            await asyncio.sleep(retry_delay(retry_after, attempt))
+
+    api_client.rest_client.request = limited_request
+    return api_client
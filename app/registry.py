@@ -0,0 +1,134 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 集群注册表: kubeconfig注册一次后，后续请求只需传clusterId
+import hmac
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from app.pool import fingerprint
+
+CLUSTER_STORE = os.environ.get('K8S_CLUSTER_STORE', '')  # 注册表持久化目录，为空时只保存在内存中
+ADMIN_TOKEN = os.environ.get('K8S_CLUSTER_ADMIN_TOKEN', '')  # 列出、注销、覆盖集群需要的令牌(Authorization: Bearer)，为空时不开放
+STORE_SUFFIX = '.kubeconfig'
+
+_CLUSTER_ID = re.compile(r'^[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?$')
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterConflict(ValueError):
+    """clusterId已被另一个kubeconfig注册"""
+
+
+class ClusterRegistry:
+
+    def __init__(self, store=CLUSTER_STORE):
+        self.store = store
+        self._clusters = {}  # clusterId -> kubeconfig
+        self._mtimes = {}  # clusterId -> 注册表文件的修改时间，多进程部署时判断其他进程是否修改过
+        self._lock = threading.Lock()
+        if store:
+            self._load()
+
+    def register(self, config_string, cluster_id=None, overwrite=False):
+        # 未指定clusterId时使用kubeconfig指纹，同一kubeconfig重复注册得到相同的ID
+        # clusterId已指向其他kubeconfig时不覆盖，否则使用该ID的请求会被悄悄转到另一个集群；需先注销或指定overwrite
+        cluster_id = cluster_id or fingerprint(config_string)[:16]
+        if not _CLUSTER_ID.match(cluster_id):
+            raise ValueError(f'invalid clusterId {cluster_id!r}, must be a DNS label')
+        with self._lock:
+            current = self._current(cluster_id)
+            if not overwrite and current is not None and fingerprint(current) != fingerprint(config_string):
+                raise ClusterConflict(f'cluster {cluster_id} is already registered with a different kubeconfig')
+            if self.store:
+                self._mtimes[cluster_id] = self._save(cluster_id, config_string)
+            self._clusters[cluster_id] = config_string
+        return cluster_id
+
+    def unregister(self, cluster_id):
+        with self._lock:
+            config_string = self._clusters.pop(cluster_id, None)
+            self._mtimes.pop(cluster_id, None)
+            if config_string is not None and self.store:
+                try:
+                    os.remove(self._path(cluster_id))
+                except FileNotFoundError:  # 已被其他进程注销
+                    pass
+        return config_string
+
+    def get(self, cluster_id):
+        if not self.store:
+            return self._clusters.get(cluster_id)
+        # 多个工作进程共享持久化目录，每次按文件修改时间确认其他进程没有注册、修改或注销该集群
+        if not _CLUSTER_ID.match(cluster_id):
+            return None
+        try:
+            mtime = os.stat(self._path(cluster_id)).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._clusters.pop(cluster_id, None)
+                self._mtimes.pop(cluster_id, None)
+            return None
+        if self._mtimes.get(cluster_id) != mtime:
+            with self._lock:
+                self._clusters[cluster_id] = self._read(cluster_id)
+                self._mtimes[cluster_id] = mtime
+        return self._clusters.get(cluster_id)
+
+    def ids(self):
+        if self.store:
+            return sorted(filename[:-len(STORE_SUFFIX)] for filename in os.listdir(self.store)
+                          if filename.endswith(STORE_SUFFIX) and _CLUSTER_ID.match(filename[:-len(STORE_SUFFIX)]))
+        return sorted(self._clusters)
+
+    def _current(self, cluster_id):
+        # 持久化时以文件为准，其他进程可能已注册该ID
+        if not self.store:
+            return self._clusters.get(cluster_id)
+        try:
+            return self._read(cluster_id)
+        except FileNotFoundError:
+            return None
+
+    def _path(self, cluster_id):
+        return os.path.join(self.store, cluster_id + STORE_SUFFIX)
+
+    def _read(self, cluster_id):
+        with open(self._path(cluster_id)) as f:
+            return f.read()
+
+    def _load(self):
+        os.makedirs(self.store, mode=0o700, exist_ok=True)
+        for filename in os.listdir(self.store):
+            cluster_id = filename[:-len(STORE_SUFFIX)]
+            if not filename.endswith(STORE_SUFFIX) or not _CLUSTER_ID.match(cluster_id):
+                continue
+            self._mtimes[cluster_id] = os.stat(self._path(cluster_id)).st_mtime_ns
+            self._clusters[cluster_id] = self._read(cluster_id)
+        logger.info('loaded %d clusters from %s', len(self._clusters), self.store)
+
+    def _save(self, cluster_id, config_string):
+        # 先写临时文件再rename，避免进程中断时留下不完整的kubeconfig；文件只允许当前用户读写
+        fd, path = tempfile.mkstemp(dir=self.store, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(config_string)
+            os.replace(path, self._path(cluster_id))
+        except BaseException:
+            os.unlink(path)
+            raise
+        return os.stat(self._path(cluster_id)).st_mtime_ns
+
+    def __len__(self):
+        return len(self._clusters)
+
+
+def is_admin(authorization):
+    # 集群列表会暴露全部clusterId，注销或覆盖clusterId会把其他调用方的请求转到另一个集群，只对持有K8S_CLUSTER_ADMIN_TOKEN的调用方开放
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(authorization or '', f'Bearer {ADMIN_TOKEN}')
+
+
+registry = ClusterRegistry()
@@ -0,0 +1,201 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 通用资源引擎: 按group/version/plural(GVR)拼接URL，通过ApiClient.call_api访问任意资源，各接口共用get/list/apply/delete逻辑
+# 内置kind登记在KINDS中；未登记的kind按apiVersion查询API Server的discovery，discovery结果按集群缓存
+import os
+import threading
+import time
+import weakref
+from urllib.parse import quote
+
+from app import codec, metrics
+from app.kube import client
+
+DISCOVERY_TTL = float(os.environ.get('K8S_DISCOVERY_TTL', '600'))  # 每个集群discovery结果的缓存时间(秒)
+MERGE_PATCH_CONTENT_TYPE = 'application/merge-patch+json'
+
+discovery_lookups = metrics.Counter('k8s_discovery_lookups_total', 'API discovery document lookups by result',
+                                    ['result'])
+
+# kind -> (group, 候选版本, plural, 是否namespaced)
+# 有多个候选版本时按集群discovery结果取第一个提供的版本，同一集群上读写使用同一个版本
+KINDS = {
+    'Namespace': ('', ('v1',), 'namespaces', False),
+    'Pod': ('', ('v1',), 'pods', True),
+    'Service': ('', ('v1',), 'services', True),
+    'ConfigMap': ('', ('v1',), 'configmaps', True),
+    'Deployment': ('apps', ('v1',), 'deployments', True),
+    'StatefulSet': ('apps', ('v1',), 'statefulsets', True),
+    'HorizontalPodAutoscaler': ('autoscaling', ('v2', 'v2beta2'), 'horizontalpodautoscalers', True),
+    'Ingress': ('networking.k8s.io', ('v1',), 'ingresses', True),
+    'VirtualService': ('networking.istio.io', ('v1beta1', 'v1alpha3', 'v1'), 'virtualservices', True),
+    'DestinationRule': ('networking.istio.io', ('v1beta1', 'v1alpha3', 'v1'), 'destinationrules', True),
+    'Gateway': ('networking.istio.io', ('v1beta1', 'v1alpha3', 'v1'), 'gateways', True),
+}
+# 资源名(plural) -> kind，watch接口和informer使用
+PLURALS = {plural: kind for kind, (_, _, plural, _) in KINDS.items()}
+
+
+class Resource:
+    """一种资源在某个集群上的group/version/plural"""
+
+    def __init__(self, kind, group, version, plural, namespaced=True):
+        self.kind = kind
+        self.group = group
+        self.version = version
+        self.plural = plural
+        self.namespaced = namespaced
+
+    @property
+    def api_version(self):
+        return f'{self.group}/{self.version}' if self.group else self.version
+
+    def path(self, namespace=None, name=None, subresource=None):
+        # namespace为None时为跨namespace的集合，集群级资源忽略namespace
+        parts = ['/apis/' + self.group if self.group else '/api', self.version]
+        if self.namespaced and namespace is not None:
+            parts += ['namespaces', quote(namespace, safe='')]
+        parts.append(self.plural)
+        if name is not None:
+            parts.append(quote(name, safe=''))
+        if subresource is not None:
+            parts.append(subresource)
+        return '/'.join(parts)
+
+
+def split_api_version(api_version):
+    group, _, version = api_version.rpartition('/')
+    return group, version
+
+
+def declared_version(kind, content):
+    # apply内容中的apiVersion与kind属于同一group时按该版本写入，请求路径与内容的版本保持一致
+    api_version = (content or {}).get('apiVersion')
+    if api_version and kind in KINDS and split_api_version(api_version)[0] == KINDS[kind][0]:
+        return api_version
+    return None
+
+
+def discovery_path(kind, api_version=None):
+    # 解析kind需要的discovery文档: 登记的kind有多个候选版本时查group提供的版本，未登记的kind查该版本的资源列表
+    # 不需要查询时返回None
+    if api_version:
+        group, version = split_api_version(api_version)
+        if kind in KINDS and KINDS[kind][0] == group:
+            return None
+        return f'/apis/{group}/{version}' if group else f'/api/{version}'
+    if kind in KINDS and len(KINDS[kind][1]) > 1:
+        return '/apis/' + KINDS[kind][0]
+    return None
+
+
+def build(kind, api_version=None, document=None):
+    # 根据登记信息和discovery文档得到Resource，找不到该kind时返回None
+    if api_version:
+        group, version = split_api_version(api_version)
+        if kind in KINDS and KINDS[kind][0] == group:
+            _, _, plural, namespaced = KINDS[kind]
+            return Resource(kind, group, version, plural, namespaced)
+        for item in (document or {}).get('resources') or []:
+            if item.get('kind') == kind and '/' not in item['name']:  # 跳过deployments/scale等子资源
+                return Resource(kind, group, version, item['name'], item.get('namespaced', True))
+        return None
+    if kind not in KINDS:
+        return None
+    group, versions, plural, namespaced = KINDS[kind]
+    served = [item['version'] for item in (document or {}).get('versions') or []]
+    return Resource(kind, group, next((v for v in versions if v in served), versions[0]), plural, namespaced)
+
+
+class DiscoveryCache:
+    """集群客户端 -> {discovery路径: (文档, 过期时间)}，客户端被连接池淘汰后一起释放"""
+
+    def __init__(self, ttl=DISCOVERY_TTL):
+        self.ttl = ttl
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, api_client, path):
+        with self._lock:
+            entry = self._clients.get(api_client, {}).get(path)
+        if entry is None or entry[1] < time.monotonic():
+            discovery_lookups.inc(result='miss')
+            return None
+        discovery_lookups.inc(result='hit')
+        return entry[0]
+
+    def put(self, api_client, path, document):
+        with self._lock:
+            self._clients.setdefault(api_client, {})[path] = (document, time.monotonic() + self.ttl)
+
+
+discovery = DiscoveryCache()
+
+
+def request_args(method, path, query=None, body=None, content_type='application/json', timeout=None):
+    # call_api的参数，query中值为None的参数不发送
+    return {'resource_path': path, 'method': method,
+            'query_params': [(key, value) for key, value in (query or {}).items() if value is not None],
+            'header_params': {'Accept': 'application/json', 'Content-Type': content_type}, 'body': body,
+            'auth_settings': ['BearerToken'], '_return_http_data_only': True, '_preload_content': False,
+            '_request_timeout': timeout}
+
+
+def call(api_client, method, path, query=None, body=None, content_type='application/json', timeout=None):
+    # 同步客户端: 与typed API的_preload_content=False一致，返回未读取的响应，非2xx时抛出ApiException
+    return api_client.call_api(**request_args(method, path, query, body, content_type, timeout))
+
+
+def resolve(api_client, kind, api_version=None):
+    path = discovery_path(kind, api_version)
+    return build(kind, api_version, None if path is None else discover(api_client, path))
+
+
+def discover(api_client, path):
+    document = discovery.get(api_client, path)
+    if document is None:
+        try:
+            document = codec.loads(call(api_client, 'GET', path).data)
+        except client.ApiException as e:
+            if e.status != 404:
+                raise
+            document = {}  # 集群上没有该group/版本，同样缓存
+        discovery.put(api_client, path, document)
+    return document
+
+
+async def call_async(api_client, method, path, query=None, body=None, content_type='application/json', timeout=None):
+    # kubernetes_asyncio: 返回aiohttp的响应，由read_body读取并检查状态码
+    return await api_client.call_api(**request_args(method, path, query, body, content_type, timeout))
+
+
+async def read_body(resp):
+    # _preload_content=False时kubernetes_asyncio不检查状态码，这里与同步客户端保持一致，非2xx抛出ApiException
+    from kubernetes_asyncio.client.rest import ApiException as AsyncApiException  # 同步模式下不导入kubernetes_asyncio
+
+    body = await resp.read()
+    if not 200 <= resp.status <= 299:
+        e = AsyncApiException(status=resp.status, reason=resp.reason)
+        e.body = body
+        raise e
+    return body
+
+
+async def resolve_async(api_client, kind, api_version=None):
+    path = discovery_path(kind, api_version)
+    return build(kind, api_version, None if path is None else await discover_async(api_client, path))
+
+
+async def discover_async(api_client, path):
+    from kubernetes_asyncio.client.rest import ApiException as AsyncApiException  # 同步模式下不导入kubernetes_asyncio
+
+    document = discovery.get(api_client, path)
+    if document is None:
+        try:
+            document = codec.loads(await read_body(await call_async(api_client, 'GET', path)))
+        except AsyncApiException as e:
+            if e.status != 404:
+                raise
+            document = {}
+        discovery.put(api_client, path, document)
+    return document
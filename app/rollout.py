@@ -0,0 +1,71 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# Deployment滚动更新进度: 判断逻辑与kubectl rollout status一致；等待时订阅deployments informer的事件，不轮询API Server
+import os
+
+ROLLOUT_TIMEOUT = float(os.environ.get('K8S_ROLLOUT_TIMEOUT', '300'))  # 等待滚动更新完成的默认超时时间(秒)
+
+
+def rollout_status(obj, generation=None, replicas=None):
+    # 返回(状态, 说明)，状态为done/progressing/failed；generation/replicas为刚写入的值，informer还没看到时视为进行中
+    name = obj['metadata']['name']
+    metadata, spec, status = obj['metadata'], obj.get('spec') or {}, obj.get('status') or {}
+    if generation is not None and metadata.get('generation', 0) < generation or \
+            replicas is not None and spec.get('replicas') != replicas:
+        return 'progressing', f'Waiting for deployment "{name}" update to be observed'
+    if status.get('observedGeneration', 0) < metadata.get('generation', 0):
+        return 'progressing', f'Waiting for deployment "{name}" spec update to be observed'
+    for condition in status.get('conditions') or []:
+        if condition.get('type') == 'Progressing' and condition.get('reason') == 'ProgressDeadlineExceeded':
+            return 'failed', f'deployment "{name}" exceeded its progress deadline'
+    desired = spec.get('replicas', 1)
+    updated = status.get('updatedReplicas', 0)
+    available = status.get('availableReplicas', 0)
+    if updated < desired:
+        return 'progressing', (f'Waiting for deployment "{name}" rollout to finish: '
+                               f'{updated} out of {desired} new replicas have been updated')
+    if status.get('replicas', 0) > updated:
+        return 'progressing', (f'Waiting for deployment "{name}" rollout to finish: '
+                               f'{status["replicas"] - updated} old replicas are pending termination')
+    if available < updated:
+        return 'progressing', (f'Waiting for deployment "{name}" rollout to finish: '
+                               f'{available} of {updated} updated replicas are available')
+    return 'done', f'deployment "{name}" successfully rolled out'
+
+
+class RolloutWatcher:
+    """消费informer订阅中的事件，直到指定Deployment滚动更新完成或失败"""
+
+    def __init__(self, name, generation=None, replicas=None):
+        self.name = name
+        self.generation = generation
+        self.replicas = replicas
+        self.obj = None
+        self.message = f'deployments.apps "{name}" not found'
+
+    def feed(self, event):
+        # 返回最终结果，仍在进行中时返回None
+        obj = event['object']
+        if event['type'] == 'ERROR':
+            return self.result('failed', obj.get('message'))
+        if event['type'] == 'BOOKMARK':
+            # 单独查询时初始对象中没有该Deployment说明不存在；写入后等待时informer可能还没看到新建的对象
+            initial_end = (obj['metadata'].get('annotations') or {}).get('k8s.io/initial-events-end')
+            if initial_end and self.obj is None and self.generation is None and self.replicas is None:
+                return self.result('failed', self.message)
+            return None
+        if event['type'] == 'DELETED':
+            return self.result('failed', f'deployment "{self.name}" was deleted')
+        self.obj = obj
+        state, self.message = rollout_status(obj, self.generation, self.replicas)
+        return None if state == 'progressing' else self.result(state, self.message)
+
+    def result(self, state, message=None):
+        status = (self.obj or {}).get('status') or {}
+        return {'name': self.name, 'status': state, 'message': message or self.message,
+                'replicas': ((self.obj or {}).get('spec') or {}).get('replicas'),
+                'updatedReplicas': status.get('updatedReplicas', 0),
+                'availableReplicas': status.get('availableReplicas', 0)}
+
+    def timeout(self, timeout):
+        return self.result('timeout', f'Timeout after {timeout}s: {self.message}')
@@ -0,0 +1,146 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# Kubernetes labelSelector解析与匹配，支持 =, ==, !=, in, notin, key, !key
+import re
+
+_REQUIREMENT = re.compile(r'''
+    ^(?:
+        !\s*(?P<not_exists>[\w./-]+)
+      | (?P<key>[\w./-]+)\s*(?:
+            (?P<op>==|=|!=)\s*(?P<value>[\w.-]*)
+          | \s(?P<set_op>in|notin)\s*\((?P<values>[^()]*)\)
+        )?
+    )$''', re.VERBOSE)
+
+
+def parse_selector(selector):
+    # 返回[(key, op, values)]，op为 in/notin/exists/!exists；等值条件统一转成in/notin
+    requirements = []
+    if not selector or not selector.strip():
+        return requirements
+    for part in _split(selector):
+        m = _REQUIREMENT.match(part.strip())
+        if m is None:
+            raise ValueError(f'invalid label selector: {selector!r}')
+        if m.group('not_exists'):
+            requirements.append((m.group('not_exists'), '!exists', None))
+        elif m.group('op'):
+            requirements.append((m.group('key'), 'notin' if m.group('op') == '!=' else 'in',
+                                 frozenset([m.group('value')])))
+        elif m.group('set_op'):
+            values = frozenset(v.strip() for v in m.group('values').split(',') if v.strip())
+            requirements.append((m.group('key'), m.group('set_op'), values))
+        else:
+            requirements.append((m.group('key'), 'exists', None))
+    return requirements
+
+
+def _split(selector):
+    # 按逗号拆分，忽略括号内的逗号
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(selector):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(selector[start:i])
+            start = i + 1
+    parts.append(selector[start:])
+    return parts
+
+
+def matches(requirements, labels):
+    labels = labels or {}
+    for key, op, values in requirements:
+        if op == 'exists':
+            if key not in labels:
+                return False
+        elif op == '!exists':
+            if key in labels:
+                return False
+        elif op == 'in':
+            if labels.get(key) not in values:
+                return False
+        elif key in labels and labels[key] in values:  # notin: 没有该label也算匹配
+            return False
+    return True
+
+
+class LabelIndex:
+    """label倒排索引: 按 key=value 与 key 记录对象名，选择器通过集合求交得到结果，不扫描全部对象"""
+
+    def __init__(self):
+        self.labels = {}  # name -> labels
+        self._values = {}  # (key, value) -> set(name)
+        self._keys = {}  # key -> set(name)
+
+    def add(self, name, labels):
+        if name in self.labels:
+            self.remove(name)
+        labels = dict(labels or {})
+        self.labels[name] = labels
+        for key, value in labels.items():
+            self._values.setdefault((key, value), set()).add(name)
+            self._keys.setdefault(key, set()).add(name)
+
+    def remove(self, name):
+        labels = self.labels.pop(name, None)
+        for key, value in (labels or {}).items():
+            _discard(self._values, (key, value), name)
+            _discard(self._keys, key, name)
+
+    def clear(self):
+        self.labels.clear()
+        self._values.clear()
+        self._keys.clear()
+
+    def select(self, requirements):
+        # 先对in/exists条件按集合大小求交，再减去notin/!exists命中的对象
+        positive, negative = [], []
+        for key, op, values in requirements:
+            if op == 'in':
+                positive.append(self._union(key, values))
+            elif op == 'exists':
+                positive.append(self._keys.get(key, _EMPTY))
+            elif op == 'notin':
+                negative.append(self._union(key, values))
+            else:
+                negative.append(self._keys.get(key, _EMPTY))
+
+        if positive:
+            positive.sort(key=len)
+            result = set(positive[0])
+            for names in positive[1:]:
+                if not result:
+                    break
+                result &= names
+        else:
+            result = set(self.labels)
+        for names in negative:
+            if not result:
+                break
+            result -= names
+        return result
+
+    def _union(self, key, values):
+        if len(values) == 1:
+            return self._values.get((key, next(iter(values))), _EMPTY)
+        names = set()
+        for value in values:
+            names |= self._values.get((key, value), _EMPTY)
+        return names
+
+    def __len__(self):
+        return len(self.labels)
+
+
+_EMPTY = frozenset()
+
+
+def _discard(index, key, name):
+    names = index.get(key)
+    if names is not None:
+        names.discard(name)
+        if not names:
+            del index[key]
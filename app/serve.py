@@ -0,0 +1,80 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 启动入口: python -m app.serve，WORKERS个进程共享同一个监听端口
+# 收到SIGTERM后readyz先返回503，DRAIN_DELAY秒后停止接收新连接，再最多等待DRAIN_TIMEOUT秒让进行中的请求完成
+import asyncio
+import logging
+import os
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from uvicorn.subprocess import get_subprocess
+
+APP_MODULE = os.environ.get('APP_MODULE', 'app.main:app')  # 同步模式app.main:app，异步模式app.aio:app
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', '9001'))
+WORKERS = int(os.environ.get('WORKERS', '1'))  # 工作进程数，建议与容器的CPU核数一致
+LOG_CONFIG = os.environ.get('LOG_CONFIG', os.path.join(os.path.dirname(__file__), 'uvicorn_config.json'))
+DRAIN_DELAY = float(os.environ.get('DRAIN_DELAY', '5'))  # 收到SIGTERM后继续服务的时间(秒)，等负载均衡摘掉本实例
+DRAIN_TIMEOUT = float(os.environ.get('DRAIN_TIMEOUT', '20'))  # 等待进行中请求完成的最长时间(秒)，超时后强制退出
+
+logger = logging.getLogger('uvicorn.error')
+
+
+class Server(uvicorn.Server):
+
+    def handle_exit(self, sig, frame):
+        from app.lifecycle import lifecycle  # 在工作进程中导入，与应用共享同一个状态
+
+        if lifecycle.draining:  # 再次收到信号时立即退出
+            self.force_exit = True
+            return
+        lifecycle.draining = True
+        logger.info('Draining, stop accepting connections in %ss', DRAIN_DELAY)
+        asyncio.get_event_loop().call_later(DRAIN_DELAY, setattr, self, 'should_exit', True)
+
+    async def shutdown(self, sockets=None):
+        from app.informer import informers
+
+        # watch流和滚动更新等待不会自行结束，通知客户端重连到其他实例
+        informers.close_subscribers('server is shutting down, reconnect with the last event id')
+        asyncio.get_event_loop().call_later(DRAIN_TIMEOUT, setattr, self, 'force_exit', True)
+        await super().shutdown(sockets)
+
+
+class Supervisor(Multiprocess):
+
+    def run(self):
+        self.startup()
+        while not self.should_exit.wait(1):
+            # 意外退出的工作进程重新拉起
+            for i, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.warning('Worker process [%s] exited with %s, restarting', process.pid, process.exitcode)
+                    self.processes[i] = get_subprocess(config=self.config, target=self.target, sockets=self.sockets)
+                    self.processes[i].start()
+        self.shutdown()
+
+    def shutdown(self):
+        # 同时通知全部工作进程开始摘流量，总耗时不随进程数增加
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info('Stopping parent process [%s]', self.pid)
+
+
+def main():
+    os.environ['WORKERS'] = str(WORKERS)  # 工作进程中的ratelimit按进程数均分集群的限额
+    config = uvicorn.Config(APP_MODULE, host=HOST, port=PORT, workers=WORKERS, log_config=LOG_CONFIG)
+    if WORKERS > 1 and not os.environ.get('K8S_CLUSTER_STORE'):
+        logger.warning('K8S_CLUSTER_STORE is not set, clusters registered in one worker are not visible to others')
+    server = Server(config)
+    if config.workers > 1:
+        Supervisor(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 相同的并发读请求只向API Server发一次，其余请求等待并共享结果；可选的短TTL缓存吸收轮询高峰
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app import metrics
+from app.pool import fingerprint
+
+READ_CACHE_TTL = float(os.environ.get('K8S_READ_CACHE_TTL', '0'))  # get*结果的缓存时间(秒)，0为只合并并发请求
+READ_CACHE_SIZE = int(os.environ.get('K8S_READ_CACHE_SIZE', '1024'))  # 最多缓存的get*结果数量
+
+shared = metrics.Counter('k8s_read_shared_total', 'get* calls answered without their own upstream call', ['source'])
+
+
+def read_key(name, params):
+    # 接口名 + 集群 + 除集群凭据外的全部参数
+    return name, fingerprint(params.configString), params.json(exclude={'configString', 'clusterId'})
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Cache:
+
+    def __init__(self, ttl, maxsize, cacheable=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.cacheable = cacheable  # cacheable(结果)为False时不缓存，如错误响应
+        self._entries = OrderedDict()  # key -> (过期时间, 结果)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    def put(self, key, value):
+        if self.ttl <= 0 or self.cacheable is not None and not self.cacheable(value):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class Group:
+    """同步版本: 第一个请求在当前线程执行fn，相同key的其他线程等待它的结果"""
+
+    def __init__(self, ttl=READ_CACHE_TTL, maxsize=READ_CACHE_SIZE, cacheable=None):
+        self._cache = _Cache(ttl, maxsize, cacheable)
+        self._calls = {}  # key -> _Call
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                shared.inc(source='cache')
+                return result
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            shared.inc(source='inflight')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                if call.error is None:
+                    self._cache.put(key, call.result)
+            call.done.set()
+        return call.result
+
+
+class AsyncGroup:
+    """异步版本: fn在独立的task中执行，某个请求被取消时不影响其他等待同一结果的请求"""
+
+    def __init__(self, ttl=READ_CACHE_TTL, maxsize=READ_CACHE_SIZE, cacheable=None):
+        self._cache = _Cache(ttl, maxsize, cacheable)
+        self._calls = {}  # key -> Task
+
+    async def do(self, key, fn):
+        result = self._cache.get(key)
+        if result is not None:
+            shared.inc(source='cache')
+            return result
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            shared.inc(source='inflight')
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._calls.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._cache.put(key, task.result())
@@ -0,0 +1,2 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
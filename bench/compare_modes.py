@@ -0,0 +1,36 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 对比同步模式(app.main)与异步模式(app.aio)在API Server高延迟下的吞吐与延迟
+# 用法: python -m bench.compare_modes --latency 0.2 --concurrency 200 --requests 2000
+import argparse
+
+from bench.harness import drive, free_port, start_app
+from bench.mock_apiserver import MockApiServer, deployment
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.2, help='模拟的API Server延迟(秒)')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    server = MockApiServer(latency=args.latency).start()
+    server.put('/apis/apps/v1/namespaces/bench/deployments', deployment('web', 'bench'))
+    payload = {'namespace': 'bench', 'deployment': 'web', 'configString': server.kubeconfig()}
+
+    for module in ('app.main:app', 'app.aio:app'):
+        port = free_port()
+        proc = start_app(module, port)
+        try:
+            url = 'http://127.0.0.1:%d/getDeployment' % port
+            drive(url, payload, args.concurrency, args.concurrency)  # 预热连接池
+            print(module, drive(url, payload, args.requests, args.concurrency))
+        finally:
+            proc.terminate()
+            proc.wait()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 压测公共方法: 启动uvicorn子进程、并发发送请求、统计吞吐与延迟
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(module, port, env=None):
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', module, '--port', str(port), '--log-level', 'warning'],
+                            env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get('http://127.0.0.1:%d/docs' % port, timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError('%s did not start' % module)
+
+
+def start_serve(port, workers, module='app.main:app', env=None):
+    # 通过app.serve以多进程方式启动，等待/readyz就绪(各工作进程完成预热)
+    env = dict(os.environ, **(env or {}), APP_MODULE=module, WORKERS=str(workers), HOST='127.0.0.1', PORT=str(port))
+    proc = subprocess.Popen([sys.executable, '-m', 'app.serve'], env=env, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get('http://127.0.0.1:%d/readyz' % port, timeout=1).status_code == 200:
+                return proc
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError('app.serve with %d workers did not start' % workers)
+
+
+def drive(url, payload, total, concurrency, method='POST', headers=None):
+    # payload为dict或payload(i)函数；HTTP 200且响应信封的code小于2000算成功
+    local = threading.local()
+    latencies = []
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = payload(i) if callable(payload) else payload
+        start = time.perf_counter()
+        r = session.request(method, url, json=body, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        return r.status_code == 200 and succeeded(r)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        ok = sum(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    return report(latencies, elapsed, ok, total)
+
+
+def succeeded(r):
+    if r.headers.get('content-type') != 'application/json':
+        return True
+    body = r.json()
+    return not isinstance(body, dict) or not isinstance(body.get('code'), int) or body['code'] < 2000
+
+
+def report(latencies, elapsed, ok, total):
+    latencies.sort()
+    return {
+        'ok': '%d/%d' % (ok, total),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p99_ms': round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 1),
+    }
@@ -0,0 +1,118 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 多集群凭据隔离: 启动N个只接受各自token的模拟API Server，并发交替访问不同集群，
+# 检查没有401(请求带错了token)且每个响应都来自目标集群(对象上的cluster标签与目标一致)，任何一项不满足时退出码为1
+# 一半集群通过clusterId访问，另一半直接传configString
+# 用法: python -m bench.isolation --clusters 8 --requests 2000 --concurrency 32
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.harness import free_port, start_app
+from bench.mock_apiserver import MockApiServer, configmap, deployment
+
+NS = 'bench'
+
+
+def check(cluster, action, body):
+    # 返回(是否401, 是否串到其他集群)
+    msg = body.get('msg')
+    if body.get('code', 0) >= 2000:
+        return isinstance(msg, dict) and msg.get('code') == 401, False
+    if action == 'applyResource':
+        return False, False
+    labels = (msg.get('metadata') or {}).get('labels') or {}
+    return False, labels.get('cluster') != cluster
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app.main:app', help='app.main:app 或 app.aio:app')
+    parser.add_argument('--clusters', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    servers = []
+    for i in range(args.clusters):
+        server = MockApiServer(token='token-%d' % i).start()
+        labels = {'app': 'web', 'cluster': 'c%d' % i}
+        server.put('/apis/apps/v1/namespaces/%s/deployments' % NS, deployment('web', NS, labels=labels))
+        servers.append(server)
+
+    port = free_port()
+    base_url = 'http://127.0.0.1:%d' % port
+    proc = start_app(args.module, port)
+    targets = []
+    for i, server in enumerate(servers):
+        if i % 2:
+            targets.append({'configString': server.kubeconfig()})
+            continue
+        ret = requests.post(base_url + '/registerCluster', json={'configString': server.kubeconfig(),
+                                                                 'clusterId': 'c%d' % i}).json()
+        assert ret['code'] == 1000, ret
+        targets.append({'clusterId': 'c%d' % i})
+
+    local = threading.local()
+    lock = threading.Lock()
+    counts = {'ok': 0, 'unauthorized': 0, 'crossed': 0, 'failed': 0}
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        index = random.randrange(args.clusters)
+        cluster = 'c%d' % index
+        action = random.choice(('getDeployment', 'getResource', 'applyResource'))
+        payload = dict(targets[index], namespace=NS)
+        if action == 'getDeployment':
+            payload['deployment'] = 'web'
+        elif action == 'getResource':
+            payload.update(kind='Deployment', name='web')
+        else:
+            cm = configmap('owner', NS, {'cluster': cluster, 'seq': str(i)})
+            cm['metadata']['labels'] = {'cluster': cluster}
+            payload['content'] = cm
+        body = session.post('%s/%s' % (base_url, action), json=payload).json()
+        unauthorized, crossed = check(cluster, action, body)
+        with lock:
+            if unauthorized:
+                counts['unauthorized'] += 1
+            elif crossed:
+                counts['crossed'] += 1
+            elif body.get('code', 0) >= 2000:
+                counts['failed'] += 1
+            else:
+                counts['ok'] += 1
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            list(executor.map(one, range(args.requests)))
+    finally:
+        proc.terminate()
+        proc.wait()
+    elapsed = time.perf_counter() - start
+
+    # apply写入的ConfigMap也必须落在自己的集群上
+    for i, server in enumerate(servers):
+        owner = server.objects.get('/api/v1/namespaces/%s/configmaps' % NS, {}).get('owner')
+        if owner is not None and owner['data']['cluster'] != 'c%d' % i:
+            counts['crossed'] += 1
+        server.stop()
+    counts['upstream_401'] = sum(server.unauthorized for server in servers)
+
+    print('clusters=%d requests=%d concurrency=%d elapsed=%.1fs' % (args.clusters, args.requests, args.concurrency,
+                                                                   elapsed))
+    print(counts)
+    if counts['unauthorized'] or counts['crossed'] or counts['upstream_401'] or counts['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# app.codec中各JSON编解码库在pod/deployment列表上的耗时对比
+# 用法: python -m bench.json_codec --items 500
+import argparse
+import json
+import timeit
+
+from app.codec import CODECS
+from bench.mock_apiserver import deployment
+from bench.passthrough import make_pod_list
+
+
+def make_deployment_list(count):
+    items = []
+    for i in range(count):
+        item = deployment('deploy-%d' % i, 'default', replicas=i % 5 + 1,
+                          labels={'app': 'app-%d' % i, 'team': 'team-%d' % (i % 8)})
+        item['metadata']['managedFields'] = [{'manager': 'kubectl', 'operation': 'Apply', 'apiVersion': 'apps/v1',
+                                              'fieldsType': 'FieldsV1',
+                                              'fieldsV1': {'f:spec': {'f:replicas': {}, 'f:template': {}}}}]
+        item['metadata']['annotations'] = {'deployment.kubernetes.io/revision': str(i % 10 + 1)}
+        item['status']['conditions'] = [{'type': t, 'status': 'True', 'reason': 'MinimumReplicasAvailable',
+                                         'lastUpdateTime': '2021-09-01T00:00:00Z'}
+                                        for t in ('Available', 'Progressing')]
+        items.append(item)
+    return json.dumps({'apiVersion': 'apps/v1', 'kind': 'DeploymentList', 'metadata': {'resourceVersion': '1'},
+                       'items': items}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    fixtures = [('PodList', make_pod_list(args.items)), ('DeploymentList', make_deployment_list(args.items))]
+    print('%-16s %-8s %10s %12s %12s %12s' % ('fixture', 'codec', 'KiB', 'loads(ms)', 'dumps(ms)', 'total(ms)'))
+    for name, raw in fixtures:
+        for codec, (loads, dumps) in CODECS.items():
+            body = loads(raw)
+            assert json.loads(dumps({'code': 1002, 'msg': body}))['msg'] == json.loads(raw)
+            t_loads = min(timeit.repeat(lambda: loads(raw), number=1, repeat=args.repeat))
+            t_dumps = min(timeit.repeat(lambda: dumps({'code': 1002, 'msg': body}), number=1, repeat=args.repeat))
+            print('%-16s %-8s %10.1f %12.3f %12.3f %12.3f' % (name, codec, len(raw) / 1024, t_loads * 1000,
+                                                              t_dumps * 1000, (t_loads + t_dumps) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# labelSelector倒排索引与线性扫描的对比
+# 用法: python -m bench.label_index --pods 50000
+import argparse
+import random
+import timeit
+
+from app.selector import LabelIndex, matches, parse_selector
+
+SELECTORS = [
+    'app=app-7',
+    'app=app-7,version=v2',
+    'tier in (frontend,cache),zone=z3',
+    'app=app-42,canary',
+    'app=app-42,!canary',
+    'version notin (v1,v2),zone!=z1',
+]
+
+
+def make_pods(count, apps):
+    rng = random.Random(42)
+    pods = {}
+    for i in range(count):
+        labels = {
+            'app': 'app-%d' % rng.randrange(apps),
+            'tier': rng.choice(['frontend', 'backend', 'cache', 'worker']),
+            'version': rng.choice(['v1', 'v2', 'v3']),
+            'zone': 'z%d' % rng.randrange(5),
+            'pod-template-hash': '%08x' % rng.getrandbits(32),
+        }
+        if rng.random() < 0.1:
+            labels['canary'] = 'true'
+        pods['pod-%d' % i] = labels
+    return pods
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pods', type=int, default=50000)
+    parser.add_argument('--apps', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    pods = make_pods(args.pods, args.apps)
+    index = LabelIndex()
+    for name, labels in pods.items():
+        index.add(name, labels)
+
+    print('%-40s %8s %12s %12s %8s' % ('selector', 'matches', 'scan(ms)', 'index(ms)', 'speedup'))
+    for selector in SELECTORS:
+        requirements = parse_selector(selector)
+        expected = {name for name, labels in pods.items() if matches(requirements, labels)}
+        assert index.select(requirements) == expected, selector
+
+        scan = min(timeit.repeat(lambda: [n for n, l in pods.items() if matches(requirements, l)],
+                                 number=1, repeat=args.repeat))
+        indexed = min(timeit.repeat(lambda: index.select(requirements), number=1, repeat=args.repeat))
+        print('%-40s %8d %12.3f %12.3f %7.0fx' % (selector, len(expected), scan * 1000, indexed * 1000,
+                                                   scan / indexed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 本地模拟的Kubernetes API Server，仅用于压测，数据全部保存在内存中
+import copy
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from app.selector import matches, parse_selector
+
+# discovery: (group, version) -> [(plural, kind, namespaced)]，同一group中排在前面的版本为preferredVersion
+# 对象按不含版本的集合路径保存，与真实API Server一样，同一资源的各个版本读写同一份数据
+API_RESOURCES = {
+    ('', 'v1'): [('namespaces', 'Namespace', False), ('pods', 'Pod', True), ('services', 'Service', True),
+                 ('configmaps', 'ConfigMap', True)],
+    ('apps', 'v1'): [('deployments', 'Deployment', True), ('deployments/scale', 'Scale', True),
+                     ('statefulsets', 'StatefulSet', True), ('statefulsets/scale', 'Scale', True)],
+    ('autoscaling', 'v2'): [('horizontalpodautoscalers', 'HorizontalPodAutoscaler', True)],
+    ('autoscaling', 'v1'): [('horizontalpodautoscalers', 'HorizontalPodAutoscaler', True)],
+    ('networking.k8s.io', 'v1'): [('ingresses', 'Ingress', True)],
+    ('gateway.networking.k8s.io', 'v1'): [('gateways', 'Gateway', True), ('httproutes', 'HTTPRoute', True)],
+}
+for _version in ('v1', 'v1beta1', 'v1alpha3'):
+    API_RESOURCES[('networking.istio.io', _version)] = [
+        ('virtualservices', 'VirtualService', True), ('destinationrules', 'DestinationRule', True),
+        ('gateways', 'Gateway', True)]
+
+
+class MockApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, token='bench'):
+        super().__init__(address, MockHandler)
+        self.latency = latency  # 每个请求的模拟延迟(秒)
+        self.token = token  # 只接受携带该token的请求，其余返回401
+        self.unauthorized = 0
+        self.objects = {}  # 集合路径 -> {name: object}
+        self.events = {}  # 集合路径 -> [(resourceVersion, type, object)]，供watch使用
+        self.compacted = 0  # 小于该resourceVersion的watch返回410
+        self.resource_version = 0
+        self.lock = threading.Condition()
+        self.requests = 0
+        self.throttled = 0  # 接下来多少个请求返回429
+        self.retry_after = None  # 429响应的Retry-After
+        self.rollout_delay = None  # 设置后模拟Deployment控制器: spec变化后generation加1，经过该时间(秒)status才全部就绪
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self.server_address
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def put(self, collection, obj):
+        collection = unversioned(collection)
+        with self.lock:
+            self.record(collection, 'ADDED' if obj['metadata']['name'] not in self.objects.get(collection, {})
+                        else 'MODIFIED', obj)
+
+    def delete(self, collection, name):
+        collection = unversioned(collection)
+        with self.lock:
+            obj = self.objects.get(collection, {}).get(name)
+            if obj is not None:
+                self.record(collection, 'DELETED', obj)
+
+    def record(self, collection, event_type, obj):
+        # 调用方需持有lock
+        self.resource_version += 1
+        obj['metadata']['resourceVersion'] = str(self.resource_version)
+        items = self.objects.setdefault(collection, {})
+        if event_type == 'DELETED':
+            items.pop(obj['metadata']['name'], None)
+        else:
+            obj['metadata']['managedFields'] = managed_fields(obj)
+            items[obj['metadata']['name']] = obj
+        self.events.setdefault(collection, []).append((self.resource_version, event_type, obj))
+        self.lock.notify_all()
+
+    def rollout(self, collection, obj):
+        # 调用方需持有lock
+        if self.rollout_delay is None or not collection.endswith('/deployments'):
+            return
+        generation = obj['metadata']['generation'] = obj['metadata'].get('generation', 0) + 1
+        timer = threading.Timer(self.rollout_delay, self._finish_rollout,
+                                (collection, obj['metadata']['name'], generation))
+        timer.daemon = True
+        timer.start()
+
+    def _finish_rollout(self, collection, name, generation):
+        with self.lock:
+            obj = self.objects.get(collection, {}).get(name)
+            if obj is None or obj['metadata'].get('generation') != generation:
+                return
+            obj = copy.deepcopy(obj)
+            replicas = obj['spec'].get('replicas', 1)
+            obj['status'] = {'observedGeneration': generation, 'replicas': replicas, 'updatedReplicas': replicas,
+                             'availableReplicas': replicas}
+            self.record(collection, 'MODIFIED', obj)
+
+    def throttle(self, count, retry_after=None):
+        # 模拟API Server限流(APF)
+        with self.lock:
+            self.throttled = count
+            self.retry_after = retry_after
+
+    def compact(self):
+        with self.lock:
+            self.compacted = self.resource_version
+            self.events.clear()
+
+    def kubeconfig(self, token=None):
+        return KUBECONFIG % {'server': self.url, 'token': token or self.token}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # keep-alive连接上响应头和响应体分开写，开启Nagle时每个响应多等一次delayed ACK(约40ms)
+
+    def log_message(self, *args):
+        pass
+
+    def _route(self):
+        path = urlsplit(self.path).path.rstrip('/')
+        parts = path.split('/')
+        # 集合路径: /api/v1/namespaces/ns/pods 或 /apis/g/v/namespaces/ns/plural，最后一段之后为对象名和子资源
+        base = 3 if parts[1] == 'api' else 4
+        if parts[base:base + 1] == ['namespaces'] and len(parts) > base + 2:
+            head = base + 3
+        else:
+            head = base + 1
+        collection = unversioned('/'.join(parts[:head]))
+        rest = parts[head:]
+        return collection, (rest[0] if rest else None), (rest[1] if len(rest) > 1 else None)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _send(self, status, obj, headers=None):
+        body = json.dumps(obj, separators=(',', ':')).encode('utf-8')  # 与API Server一样输出紧凑的JSON
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _status(self, code, reason, message):
+        self._send(code, {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {}, 'status': 'Failure',
+                          'message': message, 'reason': reason, 'code': code})
+
+    def _handle(self, method):
+        server = self.server
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        body = self._read_body() if method in ('POST', 'PATCH', 'PUT') else None
+        if self.headers.get('Authorization') != 'Bearer ' + server.token:
+            with server.lock:
+                server.unauthorized += 1
+            return self._status(401, 'Unauthorized', 'Unauthorized')
+        with server.lock:
+            throttled, server.throttled = server.throttled > 0, max(server.throttled - 1, 0)
+        if throttled:
+            return self._send(429, {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {}, 'status': 'Failure',
+                                    'message': 'Too many requests', 'reason': 'TooManyRequests', 'code': 429},
+                              {'Retry-After': server.retry_after} if server.retry_after else None)
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        if method == 'GET' and self._discovery():
+            return
+        collection, name, sub = self._route()
+        try:
+            parse_selector(query.get('labelSelector'))
+        except ValueError as e:
+            return self._status(400, 'BadRequest', str(e))
+        if method == 'GET' and name is None and query.get('watch') in ('true', 'True', '1'):
+            return self._watch(collection, query)
+        with server.lock:
+            items = server.objects.setdefault(collection, {})
+            obj = items.get(name) if name else None
+
+            if method == 'GET' and name is None:
+                prefix, plural = collection.rsplit('/', 1)
+                if '/namespaces/' not in collection and plural != 'namespaces':  # 跨namespace列表，如/apis/apps/v1/deployments
+                    items = {'%s/%s' % (c, key): obj for c, objs in server.objects.items()
+                             if c.startswith(prefix + '/namespaces/') and c.endswith('/' + plural)
+                             for key, obj in objs.items()}
+                requirements = parse_selector(query.get('labelSelector'))
+                selected = [items[key] for key in sorted(items)
+                            if matches(requirements, items[key]['metadata'].get('labels'))]
+                metadata = {'resourceVersion': str(server.resource_version)}
+                if query.get('limit'):  # continue为下一页的起始下标
+                    start = int(query.get('continue') or 0)
+                    end = start + int(query['limit'])
+                    if end < len(selected):
+                        metadata['continue'] = str(end)
+                        metadata['remainingItemCount'] = len(selected) - end
+                    selected = selected[start:end]
+                return self._send(200, {'kind': 'List', 'apiVersion': 'v1', 'metadata': metadata, 'items': selected})
+            if method == 'POST':
+                if body['metadata']['name'] in items:
+                    return self._status(409, 'AlreadyExists', '%s already exists' % body['metadata']['name'])
+                server.rollout(collection, body)
+                server.record(collection, 'ADDED', body)
+                return self._send(201, body)
+            if obj is None:
+                if method == 'PATCH' and self.headers.get('Content-Type') == 'application/apply-patch+yaml':
+                    server.rollout(collection, body)
+                    server.record(collection, 'ADDED', body)
+                    return self._send(201, body)
+                return self._status(404, 'NotFound', '%s not found' % name)
+            if method == 'GET':
+                return self._send(200, obj)
+            if method == 'DELETE':
+                server.record(collection, 'DELETED', obj)
+                return self._send(200, {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {}, 'status': 'Success'})
+            if sub == 'scale':
+                obj['spec']['replicas'] = body['spec']['replicas']
+                server.rollout(collection, obj)
+                server.record(collection, 'MODIFIED', obj)
+                return self._send(200, {'kind': 'Scale', 'apiVersion': 'autoscaling/v1',
+                                        'metadata': {'name': name, 'namespace': obj['metadata'].get('namespace')},
+                                        'spec': {'replicas': obj['spec']['replicas']}})
+            merge(obj, body)
+            server.rollout(collection, obj)
+            server.record(collection, 'MODIFIED', obj)
+            return self._send(200, obj)
+
+    def _discovery(self):
+        # /api、/api/v1、/apis/group、/apis/group/version，已处理时返回True
+        parts = urlsplit(self.path).path.rstrip('/').split('/')[1:]
+        if parts == ['api']:
+            self._send(200, {'kind': 'APIVersions', 'versions': ['v1']})
+        elif parts[:1] == ['apis'] and len(parts) == 2:
+            items = [{'groupVersion': '%s/%s' % (group, version), 'version': version}
+                     for group, version in API_RESOURCES if group == parts[1]]
+            if items:
+                self._send(200, {'kind': 'APIGroup', 'apiVersion': 'v1', 'name': parts[1], 'versions': items,
+                                 'preferredVersion': items[0]})
+            else:
+                self._status(404, 'NotFound', 'the server could not find the requested resource')
+        elif parts[:1] == ['api'] and len(parts) == 2 or parts[:1] == ['apis'] and len(parts) == 3:
+            group, version = ('', parts[1]) if parts[0] == 'api' else (parts[1], parts[2])
+            if (group, version) in API_RESOURCES:
+                resources = [{'name': plural, 'namespaced': namespaced, 'kind': kind,
+                              'verbs': ['get', 'list', 'watch', 'create', 'update', 'patch', 'delete']}
+                             for plural, kind, namespaced in API_RESOURCES[(group, version)]]
+                self._send(200, {'kind': 'APIResourceList', 'apiVersion': 'v1',
+                                 'groupVersion': '%s/%s' % (group, version) if group else version,
+                                 'resources': resources})
+            else:
+                self._status(404, 'NotFound', 'the server could not find the requested resource')
+        else:
+            return False
+        return True
+
+    def _watch(self, collection, query):
+        # 以chunked编码逐行输出watch事件，超时后发送BOOKMARK并结束响应
+        server = self.server
+        requirements = parse_selector(query.get('labelSelector'))
+        since = int(query.get('resourceVersion') or server.resource_version)
+        deadline = time.monotonic() + float(query.get('timeoutSeconds') or 30)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            if since < server.compacted:
+                self._event('ERROR', {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'code': 410,
+                                      'reason': 'Expired', 'message': 'too old resource version'})
+            else:
+                since = self._stream(collection, requirements, since, deadline)
+                if query.get('allowWatchBookmarks') in ('true', 'True'):
+                    self._event('BOOKMARK', {'kind': 'Bookmark', 'metadata': {'resourceVersion': str(since)}})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _stream(self, collection, requirements, since, deadline):
+        server = self.server
+        while True:
+            with server.lock:
+                pending = [e for e in server.events.get(collection, []) if e[0] > since]
+                if not pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    server.lock.wait(min(remaining, 1.0))
+                    continue
+            for rv, event_type, obj in pending:
+                since = rv
+                if matches(requirements, obj['metadata'].get('labels')):
+                    self._event(event_type, obj)
+        return since
+
+    def _event(self, event_type, obj):
+        line = json.dumps({'type': event_type, 'object': obj}, separators=(',', ':')).encode('utf-8') + b'\n'
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+def unversioned(collection):
+    # /apis/group/version/... -> /apis/group/...，/api/v1只有一个版本，保持不变
+    parts = collection.split('/')
+    return '/'.join(parts[:3] + parts[4:]) if parts[1:2] == ['apis'] else collection
+
+
+def merge(target, patch):
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def managed_fields(obj, time='2024-01-01T00:00:00Z'):
+    # 与API Server一样记录字段归属: 客户端写入的metadata/spec等归kubectl，status归控制器
+    metadata = {key: obj['metadata'][key] for key in ('labels', 'annotations') if obj['metadata'].get(key)}
+    owned = dict({key: value for key, value in obj.items() if key not in ('apiVersion', 'kind', 'metadata', 'status')},
+                 metadata=metadata)
+    fields = fields_v1(owned)
+    fields.pop('.')  # 对象本身不记录'.'
+    entries = [{'manager': 'kubectl', 'operation': 'Update', 'apiVersion': obj.get('apiVersion', 'v1'), 'time': time,
+                'fieldsType': 'FieldsV1', 'fieldsV1': fields}]
+    if obj.get('status'):
+        entries.append({'manager': 'kube-controller-manager', 'operation': 'Update',
+                        'apiVersion': obj.get('apiVersion', 'v1'), 'time': time, 'fieldsType': 'FieldsV1',
+                        'fieldsV1': {'f:status': fields_v1(obj['status'])}, 'subresource': 'status'})
+    return entries
+
+
+def fields_v1(value):
+    # FieldsV1: 对象字段为f:<name>，按name区分的列表元素为k:{"name":...}，其他列表元素为v:<值>
+    if isinstance(value, dict):
+        return dict({'.': {}} if value else {}, **{'f:' + key: fields_v1(item) for key, item in value.items()})
+    if isinstance(value, list):
+        fields = {}
+        for item in value:
+            if isinstance(item, dict) and 'name' in item:
+                fields['k:' + json.dumps({'name': item['name']}, separators=(',', ':'))] = fields_v1(item)
+            elif not isinstance(item, (dict, list)):
+                fields['v:' + json.dumps(item)] = {}
+        return fields
+    return {}
+
+
+def deployment(name, namespace, replicas=1, labels=None):
+    labels = labels or {'app': name}
+    return {
+        'apiVersion': 'apps/v1', 'kind': 'Deployment',
+        'metadata': {'name': name, 'namespace': namespace, 'labels': labels},
+        'spec': {
+            'replicas': replicas,
+            'selector': {'matchLabels': labels},
+            'template': {'metadata': {'labels': labels},
+                         'spec': {'containers': [{'name': name, 'image': 'nginx:1.21'}]}},
+        },
+        'status': {'replicas': replicas, 'updatedReplicas': replicas, 'availableReplicas': replicas},
+    }
+
+
+def pod(name, namespace, labels):
+    return {
+        'apiVersion': 'v1', 'kind': 'Pod',
+        'metadata': {'name': name, 'namespace': namespace, 'labels': labels},
+        'spec': {'containers': [{'name': 'main', 'image': 'nginx:1.21'}]},
+        'status': {'phase': 'Running'},
+    }
+
+
+def service(name, namespace, labels=None):
+    labels = labels or {'app': name}
+    return {
+        'apiVersion': 'v1', 'kind': 'Service',
+        'metadata': {'name': name, 'namespace': namespace, 'labels': labels},
+        'spec': {'selector': labels, 'ports': [{'port': 80, 'targetPort': 8080, 'protocol': 'TCP'}]},
+    }
+
+
+def namespace(name):
+    return {'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': name}, 'status': {'phase': 'Active'}}
+
+
+def virtual_service(name, namespace):
+    return {
+        'apiVersion': 'networking.istio.io/v1beta1', 'kind': 'VirtualService',
+        'metadata': {'name': name, 'namespace': namespace},
+        'spec': {'hosts': [name], 'http': [{'route': [{'destination': {'host': name, 'subset': 'v1'}}]}]},
+    }
+
+
+def destination_rule(name, namespace):
+    return {
+        'apiVersion': 'networking.istio.io/v1beta1', 'kind': 'DestinationRule',
+        'metadata': {'name': name, 'namespace': namespace},
+        'spec': {'host': name, 'subsets': [{'name': 'v1', 'labels': {'version': 'v1'}}]},
+    }
+
+
+def configmap(name, namespace, data=None):
+    return {'apiVersion': 'v1', 'kind': 'ConfigMap', 'metadata': {'name': name, 'namespace': namespace},
+            'data': data or {'key': name}}
+
+
+def hpa(name, namespace):
+    return {
+        'apiVersion': 'autoscaling/v2beta2', 'kind': 'HorizontalPodAutoscaler',
+        'metadata': {'name': name, 'namespace': namespace},
+        'spec': {'scaleTargetRef': {'apiVersion': 'apps/v1', 'kind': 'Deployment', 'name': name},
+                 'minReplicas': 1, 'maxReplicas': 10,
+                 'metrics': [{'type': 'Resource',
+                              'resource': {'name': 'cpu', 'target': {'type': 'Utilization',
+                                                                      'averageUtilization': 80}}}]},
+    }
+
+
+KUBECONFIG = """apiVersion: v1
+kind: Config
+clusters:
+- name: mock
+  cluster:
+    server: %(server)s
+users:
+- name: mock
+  user:
+    token: %(token)s
+contexts:
+- name: mock
+  context:
+    cluster: mock
+    user: mock
+current-context: mock
+"""
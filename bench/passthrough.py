@@ -0,0 +1,67 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# get*接口: 解析后重新序列化(json.loads + JSONResponse) 与 原样拼接API Server字节(raw_response) 的CPU开销对比
+# 对象与真实API Server一样带有managedFields，默认(managedFields=false)需要去掉，对比解析后裁剪与在字节上删除的开销
+# 用法: python -m bench.passthrough --pods 500
+import argparse
+import json
+import timeit
+
+from fastapi.responses import JSONResponse
+
+from app import codec
+from app.main import raw_response
+from app.projection import project_body, strip_managed_fields_raw
+from bench.mock_apiserver import managed_fields, pod
+
+
+def make_pod_list(count):
+    items = []
+    for i in range(count):
+        item = pod('pod-%d' % i, 'default', {'app': 'app-%d' % (i % 20), 'pod-template-hash': '%08x' % i})
+        item['spec'] = {'containers': [{'name': 'main', 'image': 'registry.local/app:1.%d' % i,
+                                        'ports': [{'containerPort': 8080, 'protocol': 'TCP'}],
+                                        'env': [{'name': 'ENV_%d' % j, 'value': 'x' * 32} for j in range(10)],
+                                        'resources': {'limits': {'cpu': '1', 'memory': '1Gi'}}}]}
+        item['status'] = {'phase': 'Running', 'podIP': '10.0.%d.%d' % (i // 256, i % 256),
+                          'conditions': [{'type': t, 'status': 'True'} for t in ('Ready', 'PodScheduled')]}
+        item['metadata']['managedFields'] = managed_fields(item)
+        items.append(item)
+    return json.dumps({'apiVersion': 'v1', 'kind': 'PodList', 'metadata': {'resourceVersion': '1'},
+                       'items': items}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pods', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    raw = make_pod_list(args.pods)
+    parsed = JSONResponse(content={'code': 1002, 'msg': json.loads(raw)}).body
+    assert json.loads(raw_response(raw, code=1002).body) == json.loads(parsed)
+
+    decode = min(timeit.repeat(lambda: JSONResponse(content={'code': 1002, 'msg': json.loads(raw)}),
+                               number=1, repeat=args.repeat))
+    splice = min(timeit.repeat(lambda: raw_response(raw, code=1002), number=1, repeat=args.repeat))
+    print('%d pods, %.1f KiB' % (args.pods, len(raw) / 1024))
+    print('managedFields=true')
+    print('  %-38s %10.3f ms' % ('json.loads+JSONResponse', decode * 1000))
+    print('  %-38s %10.3f ms' % ('raw_response', splice * 1000))
+    print('  %-38s %9.0fx' % ('speedup', decode / splice))
+
+    # 默认路径: 去掉managedFields
+    stripped = strip_managed_fields_raw(raw)
+    assert json.loads(stripped) == project_body(json.loads(raw), None)
+    project = min(timeit.repeat(lambda: codec.JSONResponse(content={'code': 1002, 'msg': project_body(
+        codec.loads(raw), None)}), number=1, repeat=args.repeat))
+    strip = min(timeit.repeat(lambda: raw_response(strip_managed_fields_raw(raw), code=1002), number=1,
+                              repeat=args.repeat))
+    print('managedFields=false (%.1f KiB after stripping)' % (len(stripped) / 1024))
+    print('  %-38s %10.3f ms' % ('codec.loads+project_body+JSONResponse', project * 1000))
+    print('  %-38s %10.3f ms' % ('strip_managed_fields_raw+raw_response', strip * 1000))
+    print('  %-38s %9.1fx' % ('speedup', project / strip))
+
+
+if __name__ == '__main__':
+    main()
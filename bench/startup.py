@@ -0,0 +1,67 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 冷启动耗时: 从启动进程到/livez可访问(开始监听)、/readyz就绪、第一个getDeployment请求返回的时间
+# 分别测试K8S_PRELOAD=1(启动后后台导入kubernetes客户端)和K8S_PRELOAD=0(第一个请求时导入)
+# 用法: python -m bench.startup --module app.main:app --runs 5
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+from bench.harness import free_port
+from bench.mock_apiserver import MockApiServer, deployment
+
+
+def wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError('%s not ready' % url)
+
+
+def run_once(module, preload, payload):
+    port = free_port()
+    base_url = 'http://127.0.0.1:%d' % port
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', module, '--port', str(port), '--log-level', 'warning'],
+                            env=dict(os.environ, K8S_PRELOAD=preload))
+    try:
+        live = wait_for(base_url + '/livez', start + 30)
+        ready = wait_for(base_url + '/readyz', start + 30)
+        resp = requests.post(base_url + '/getDeployment', json=payload)
+        first = time.perf_counter()
+        assert resp.json()['code'] == 1002, resp.text
+        return {'livez': live - start, 'readyz': ready - start, 'first_request': first - start}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app.main:app', help='app.main:app 或 app.aio:app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--preload', default='1,0', help='逗号分隔的K8S_PRELOAD取值')
+    args = parser.parse_args()
+
+    server = MockApiServer().start()
+    server.put('/apis/apps/v1/namespaces/bench/deployments', deployment('web', 'bench'))
+    payload = {'namespace': 'bench', 'deployment': 'web', 'configString': server.kubeconfig()}
+    print('%-10s %10s %10s %14s' % ('preload', 'livez_ms', 'readyz_ms', 'first_req_ms'))
+    for preload in args.preload.split(','):
+        runs = [run_once(args.module, preload, payload) for _ in range(args.runs)]
+        print('%-10s %10.0f %10.0f %14.0f' % (preload, *(statistics.median(run[key] for run in runs) * 1000
+                                                        for key in ('livez', 'readyz', 'first_request'))))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
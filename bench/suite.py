@@ -0,0 +1,202 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 全接口压测: 启动本地模拟API Server和服务进程，按不同并发逐个压测app中的接口，输出吞吐与p50/p99延迟
+# 用法: python -m bench.suite --concurrency 1,16,64 --requests 500 --json after.json --baseline before.json
+import argparse
+import json
+import os
+
+import requests
+
+from bench.harness import drive, free_port, start_app
+from bench.mock_apiserver import (MockApiServer, configmap, deployment, destination_rule, hpa, namespace, pod,
+                                  service, virtual_service)
+
+NS = 'bench'
+PODS = '/api/v1/namespaces/%s/pods' % NS
+DEPLOYMENTS = '/apis/apps/v1/namespaces/%s/deployments' % NS
+SERVICES = '/api/v1/namespaces/%s/services' % NS
+NAMESPACES = '/api/v1/namespaces'
+VIRTUAL_SERVICES = '/apis/networking.istio.io/v1alpha3/namespaces/%s/virtualservices' % NS
+DESTINATION_RULES = '/apis/networking.istio.io/v1alpha3/namespaces/%s/destinationrules' % NS
+HPAS = '/apis/autoscaling/v2beta2/namespaces/%s/horizontalpodautoscalers' % NS
+CONFIGMAPS = '/api/v1/namespaces/%s/configmaps' % NS
+ADMIN_TOKEN = 'bench-admin'  # 注销集群需要K8S_CLUSTER_ADMIN_TOKEN
+
+
+def seed(server, args):
+    for i in range(args.pods):
+        server.put(PODS, pod('pod-%d' % i, NS, {'app': 'app-%d' % (i % 20)}))
+    for i in range(args.deployments):
+        server.put(DEPLOYMENTS, deployment('deploy-%d' % i, NS, labels={'app': 'app-%d' % (i % 20)}))
+    for i in range(args.services):
+        server.put(SERVICES, service('svc-%d' % i, NS))
+    for i in range(args.namespaces):
+        server.put(NAMESPACES, namespace('ns-%d' % i))
+    server.put(NAMESPACES, namespace(NS))
+    for i in range(args.istio):
+        server.put(VIRTUAL_SERVICES, virtual_service('vs-%d' % i, NS))
+        server.put(DESTINATION_RULES, destination_rule('dr-%d' % i, NS))
+        server.put(CONFIGMAPS, configmap('cm-%d' % i, NS))
+
+
+def http_route(name, namespace):
+    # 未登记在KINDS中的kind，按apiVersion走discovery
+    return {'apiVersion': 'gateway.networking.k8s.io/v1', 'kind': 'HTTPRoute',
+            'metadata': {'name': name, 'namespace': namespace},
+            'spec': {'rules': [{'backendRefs': [{'name': name, 'port': 80}]}]}}
+
+
+def scenario(name, path, payload, method='POST', setup=None, headers=None):
+    # setup(tag, count)在每轮压测前准备数据，payload(i)中的名称带上tag，避免不同并发轮次互相影响
+    return {'name': name, 'path': path, 'payload': payload, 'method': method, 'setup': setup, 'headers': headers}
+
+
+def scenarios(server, args, base_url):
+    kc = server.kubeconfig()
+    common = {'namespace': NS, 'configString': kc}
+    tag = {}  # 当前轮次的标识，由main设置
+
+    def payload(**fields):
+        # fields中的函数按请求序号i求值
+        return lambda i: dict(common, **{k: v(i) if callable(v) else v for k, v in fields.items()})
+
+    def put_many(collection, make):
+        return lambda count: [server.put(collection, make('%s-%d' % (tag['name'], i), NS)) for i in range(count)]
+
+    def register_many(count):
+        for i in range(count):
+            requests.post(base_url + '/registerCluster', json={'configString': kc,
+                                                               'clusterId': '%s-%d' % (tag['name'], i)})
+
+    deploy = lambda i: 'deploy-%d' % (i % args.deployments)  # noqa: E731
+    cm = lambda i: 'cm-%d' % (i % args.istio)  # noqa: E731
+    removed = lambda i: '%s-%d' % (tag['name'], i)  # noqa: E731
+
+    return tag, [
+        scenario('getPods', '/getPods', payload()),
+        scenario('getPods/labelSelector', '/getPods', payload(labelSelector='app=app-3')),
+        scenario('getPods/fields', '/getPods', payload(fields=['metadata.name', 'status.phase'])),
+        scenario('getPods/limit', '/getPods', payload(limit=50)),
+        scenario('getPods/stream', '/getPods', payload(stream=True)),
+        scenario('getDeployment', '/getDeployment', payload(deployment=deploy)),
+        scenario('getService', '/getService', payload(service=lambda i: 'svc-%d' % (i % args.services))),
+        scenario('getVirtualService', '/getVirtualService',
+                 payload(virtualService=lambda i: 'vs-%d' % (i % args.istio))),
+        scenario('getVirtualService/list', '/getVirtualService', payload()),
+        scenario('getDestinationRule', '/getDestinationRule',
+                 payload(destination=lambda i: 'dr-%d' % (i % args.istio))),
+        scenario('getNameSpaces', '/getNameSpaces', payload()),
+        scenario('getNameSpace', '/getNameSpace', payload()),
+        scenario('getResource', '/getResource', payload(kind='ConfigMap', name=cm)),
+        scenario('getResource/list', '/getResource', payload(kind='ConfigMap')),
+        scenario('applyDeployment', '/applyDeployment',
+                 payload(deployment=deploy, content=lambda i: deployment(deploy(i), NS, i % 5 + 1))),
+        scenario('applyService', '/applyService',
+                 payload(service=lambda i: 'svc-%d' % (i % args.services),
+                         content=lambda i: service('svc-%d' % (i % args.services), NS))),
+        scenario('applyVirtualService', '/applyVirtualService',
+                 payload(virtualService=lambda i: 'vs-%d' % (i % args.istio),
+                         content=lambda i: virtual_service('vs-%d' % (i % args.istio), NS))),
+        scenario('applyDestinationRule', '/applyDestinationRule',
+                 payload(destination=lambda i: 'dr-%d' % (i % args.istio),
+                         content=lambda i: destination_rule('dr-%d' % (i % args.istio), NS))),
+        scenario('applyhpa', '/applyhpa', payload(hpa=deploy, content=lambda i: hpa(deploy(i), NS))),
+        scenario('applyResource', '/applyResource', payload(content=lambda i: configmap(cm(i), NS, {'n': str(i % 5)}))),
+        scenario('applyResource/discovery', '/applyResource', payload(content=lambda i: http_route(cm(i), NS))),
+        scenario('modifyDeployment', '/modifyDeployment', payload(deployment=deploy, replicas=lambda i: i % 5 + 1)),
+        scenario('batchApply', '/batchApply',
+                 payload(items=lambda i: [deployment(deploy(i), NS), service('svc-%d' % (i % args.services), NS),
+                                          virtual_service('vs-%d' % (i % args.istio), NS)])),
+        scenario('bulkScale', '/bulkScale',
+                 payload(items=lambda i: [{'deployment': deploy(i + j), 'replicas': i % 5 + 1} for j in range(10)])),
+        scenario('fanoutQuery', '/fanoutQuery',
+                 lambda i: {'clusters': [{'name': 'c%d' % j, 'configString': kc} for j in range(3)],
+                            'action': 'getDeployment', 'query': {'namespace': NS, 'deployment': deploy(i)}}),
+        scenario('delDeployment', '/delDeployment', payload(deployment=removed), 'DELETE',
+                 put_many(DEPLOYMENTS, deployment)),
+        scenario('delService', '/delService', payload(service=removed), 'DELETE', put_many(SERVICES, service)),
+        scenario('delVirtualService', '/delVirtualService', payload(virtualService=removed), 'DELETE',
+                 put_many(VIRTUAL_SERVICES, virtual_service)),
+        scenario('delDestinationRule', '/delDestinationRule', payload(destination=removed), 'DELETE',
+                 put_many(DESTINATION_RULES, destination_rule)),
+        scenario('delhpa', '/delhpa', payload(hpa=removed), 'DELETE', put_many(HPAS, hpa)),
+        scenario('delResource', '/delResource', payload(kind='ConfigMap', name=removed), 'DELETE',
+                 put_many(CONFIGMAPS, configmap)),
+        scenario('registerCluster', '/registerCluster', {'configString': kc}),
+        scenario('unregisterCluster', '/unregisterCluster', lambda i: {'clusterId': removed(i)}, 'DELETE',
+                 register_many, {'Authorization': 'Bearer ' + ADMIN_TOKEN}),
+        scenario('metrics', '/metrics', None, 'GET'),
+    ]
+
+
+def compare(rows, baseline):
+    before = {(row['scenario'], row['concurrency']): row for row in baseline}
+    print('\n%-26s %5s %10s %10s' % ('scenario', 'conc', 'rps', 'p99'))
+    for row in rows:
+        old = before.get((row['scenario'], row['concurrency']))
+        if old is None:
+            continue
+        print('%-26s %5d %+9.1f%% %+9.1f%%' % (row['scenario'], row['concurrency'],
+                                              (row['rps'] / old['rps'] - 1) * 100,
+                                              (row['p99_ms'] / old['p99_ms'] - 1) * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app.main:app', help='app.main:app 或 app.aio:app')
+    parser.add_argument('--latency', type=float, default=0.01, help='模拟的API Server延迟(秒)')
+    parser.add_argument('--pods', type=int, default=500)
+    parser.add_argument('--deployments', type=int, default=100)
+    parser.add_argument('--services', type=int, default=100)
+    parser.add_argument('--namespaces', type=int, default=20)
+    parser.add_argument('--istio', type=int, default=50, help='VirtualService/DestinationRule/ConfigMap的数量')
+    parser.add_argument('--requests', type=int, default=500, help='每个接口每种并发的请求数')
+    parser.add_argument('--concurrency', default='1,16,64', help='逗号分隔的并发数')
+    parser.add_argument('--only', default='', help='只压测名称以这些前缀开头的场景，逗号分隔')
+    parser.add_argument('--json', help='把结果写入该文件')
+    parser.add_argument('--baseline', help='与之前--json保存的结果对比')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='保留客户端限速(K8S_READ_QPS/K8S_WRITE_QPS)，默认关闭，否则写接口测到的是令牌桶')
+    args = parser.parse_args()
+
+    server = MockApiServer(latency=args.latency).start()
+    seed(server, args)
+    port = free_port()
+    base_url = 'http://127.0.0.1:%d' % port
+    env = dict(os.environ, K8S_CLUSTER_ADMIN_TOKEN=ADMIN_TOKEN)
+    if not args.rate_limit:
+        env.update(K8S_READ_QPS='0', K8S_WRITE_QPS='0')
+    proc = start_app(args.module, port, env)
+    rows = []
+    try:
+        tag, cases = scenarios(server, args, base_url)
+        prefixes = tuple(p for p in args.only.split(',') if p)
+        print('%-26s %5s %9s %9s %9s %9s' % ('scenario', 'conc', 'ok', 'rps', 'p50_ms', 'p99_ms'))
+        for case in cases:
+            if prefixes and not case['name'].startswith(prefixes):
+                continue
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                tag['name'] = 'c%d' % concurrency
+                if case['setup'] is not None:
+                    case['setup'](args.requests)
+                result = drive(base_url + case['path'], case['payload'], args.requests, concurrency, case['method'],
+                               case['headers'])
+                rows.append(dict(scenario=case['name'], concurrency=concurrency, **result))
+                print('%-26s %5d %9s %9.1f %9.1f %9.1f' % (case['name'], concurrency, result['ok'], result['rps'],
+                                                         result['p50_ms'], result['p99_ms']))
+    finally:
+        proc.terminate()
+        proc.wait()
+        server.stop()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(rows, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
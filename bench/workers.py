@@ -0,0 +1,42 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# 多进程扩展性: 分别以1/2/4/8个工作进程启动app.serve，压测从informer缓存读取并序列化大列表的getPods
+# 请求几乎不访问API Server，吞吐主要受限于JSON序列化等CPU开销，应随CPU核数增长
+# 用法: python -m bench.workers --workers 1,2,4,8 --pods 500 --requests 2000 --concurrency 64
+import argparse
+import os
+
+from bench.harness import drive, free_port, start_serve
+from bench.mock_apiserver import MockApiServer, pod
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app.main:app', help='app.main:app 或 app.aio:app')
+    parser.add_argument('--workers', default='1,2,4,8', help='逗号分隔的工作进程数')
+    parser.add_argument('--pods', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    server = MockApiServer().start()
+    for i in range(args.pods):
+        server.put('/api/v1/namespaces/bench/pods', pod('pod-%d' % i, 'bench', {'app': 'app-%d' % (i % 20)}))
+    payload = {'namespace': 'bench', 'configString': server.kubeconfig()}
+
+    print('cpus: %d' % os.cpu_count())
+    for workers in (int(w) for w in args.workers.split(',')):
+        port = free_port()
+        proc = start_serve(port, workers, args.module, env={'K8S_INFORMER_CACHE': '1'})
+        try:
+            url = 'http://127.0.0.1:%d/getPods' % port
+            drive(url, payload, args.concurrency * 4, args.concurrency)  # 每个进程各自建立informer
+            print('workers=%d' % workers, drive(url, payload, args.requests, args.concurrency))
+        finally:
+            proc.terminate()
+            proc.wait()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()